@@ -0,0 +1,143 @@
+import cv2
+import argparse
+import glob
+import logging
+import os
+import time
+from typing import List, Tuple
+
+from person_detectors import DNNPersonDetector, HOGPersonDetector, PersonDetector
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+# Frame size used for the multi-camera pipeline run, so every camera's frames line up
+PIPELINE_FRAME_SIZE = (640, 480)
+
+
+def load_dataset(root: str) -> List[Tuple[object, bool]]:
+    """
+    Load labelled frames from root/person/ and root/empty/
+
+    Frames in person/ contain at least one person, frames in empty/ none.
+    """
+    samples = []
+    for label, has_person in (("person", True), ("empty", False)):
+        for pattern in IMAGE_PATTERNS:
+            for path in sorted(glob.glob(os.path.join(root, label, pattern))):
+                frame = cv2.imread(path)
+                if frame is None:
+                    logger.warning(f"Skipping unreadable image {path}")
+                    continue
+                samples.append((frame, has_person))
+
+    if not samples:
+        raise ValueError(f"No images found under {root}/person or {root}/empty")
+    return samples
+
+
+def benchmark(detector: PersonDetector, samples, batch_size: int) -> dict:
+    """Presence accuracy and throughput of one backend at one batch size"""
+    true_pos = false_pos = true_neg = false_neg = 0
+    started = time.perf_counter()
+
+    for start in range(0, len(samples), batch_size):
+        batch = samples[start:start + batch_size]
+        boxes = detector.detect_batch([frame for frame, _ in batch])
+        for (_, has_person), found in zip(batch, boxes):
+            detected = len(found) > 0
+            if detected and has_person:
+                true_pos += 1
+            elif detected:
+                false_pos += 1
+            elif has_person:
+                false_neg += 1
+            else:
+                true_neg += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        "backend": detector.name,
+        "batch": batch_size,
+        "fps": len(samples) / elapsed,
+        "accuracy": (true_pos + true_neg) / len(samples),
+        "precision": true_pos / (true_pos + false_pos) if true_pos + false_pos else 0.0,
+        "recall": true_pos / (true_pos + false_neg) if true_pos + false_neg else 0.0,
+    }
+
+
+def benchmark_cameras(detector: PersonDetector, samples, cameras: int, detect_interval: int) -> dict:
+    """Full pipeline throughput with one batched detector call per round of camera frames"""
+    from main import GridMotionDetector, process_camera_batch
+
+    grid_detectors = [
+        GridMotionDetector(camera_url=f"file://camera{index}", esp_urls={}, room=f"camera{index}",
+                           person_detector=detector, detect_interval=detect_interval,
+                           actuate=False, heatmap_dir=None)
+        for index in range(cameras)
+    ]
+    frames = [cv2.resize(frame, PIPELINE_FRAME_SIZE) for frame, _ in samples]
+
+    processed = 0
+    started = time.perf_counter()
+    for start in range(0, len(frames) - cameras + 1, cameras):
+        # Frames are drawn on, so each camera gets its own copy, stamped as it is taken
+        batch = []
+        capture_ts = []
+        for frame in frames[start:start + cameras]:
+            batch.append(frame.copy())
+            capture_ts.append(time.monotonic())
+        process_camera_batch(grid_detectors, batch, detector, capture_ts)
+        processed += cameras
+    elapsed = time.perf_counter() - started
+
+    stages = grid_detectors[0].latency_tracer.summary()["stages"]
+    return {
+        "backend": detector.name,
+        "cameras": cameras,
+        "fps": processed / elapsed if elapsed else 0.0,
+        "detection_p95_ms": stages.get("detection", {}).get("p95_ms", 0.0),
+        "queue_p50_ms": stages.get("capture_queue", {}).get("p50_ms", 0.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare person detector accuracy against throughput")
+    parser.add_argument("dataset", help="Directory with person/ and empty/ image folders")
+    parser.add_argument("--model", help="DNN model weights; the dnn backend is skipped without it")
+    parser.add_argument("--config", help="DNN network description, if the model format needs one")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8],
+                        help="Batch sizes to try (frames per inference call)")
+    parser.add_argument("--cameras", type=int, nargs="+", default=[],
+                        help="Also run the full pipeline with N cameras sharing batched detector calls")
+    parser.add_argument("--detect-interval", type=int, default=5,
+                        help="Detector runs every N frames per camera in the pipeline run")
+    args = parser.parse_args()
+
+    samples = load_dataset(args.dataset)
+    detectors = [HOGPersonDetector()]
+    if args.model:
+        detectors.append(DNNPersonDetector(args.model, args.config))
+
+    print(f"\n=== Person Detector Benchmark ({len(samples)} frames) ===")
+    print(f"{'backend':<8} {'batch':>5} {'fps':>8} {'accuracy':>9} {'precision':>10} {'recall':>7}")
+    for detector in detectors:
+        for batch_size in args.batch_sizes:
+            result = benchmark(detector, samples, batch_size)
+            print(f"{result['backend']:<8} {result['batch']:>5} {result['fps']:>8.1f} "
+                  f"{result['accuracy']:>9.3f} {result['precision']:>10.3f} {result['recall']:>7.3f}")
+
+    if args.cameras:
+        print(f"\n=== Multi-Camera Pipeline (detect every {args.detect_interval} frames) ===")
+        print(f"{'backend':<8} {'cameras':>7} {'fps':>8} {'queue p50 ms':>13} {'detect p95 ms':>14}")
+        for detector in detectors:
+            for cameras in args.cameras:
+                result = benchmark_cameras(detector, samples, cameras, args.detect_interval)
+                print(f"{result['backend']:<8} {result['cameras']:>7} {result['fps']:>8.1f} "
+                      f"{result['queue_p50_ms']:>13.1f} {result['detection_p95_ms']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import cv2
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CameraCapture:
+    """
+    Reads a camera stream on its own thread and reconnects in the background
+
+    Only the newest frame is kept, stamped with its capture time. Failed
+    connects and reads are retried with jittered exponential backoff, and
+    outages are timed. Each camera gets its own CameraCapture, so cameras
+    reconnect independently of each other and of the vision loop.
+    """
+
+    def __init__(self, camera_url: str, name: str = "camera",
+                 initial_backoff: float = 0.5, max_backoff: float = 30.0,
+                 on_connected: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            camera_url (str): Stream URL passed to cv2.VideoCapture
+            name (str): Camera name used in logs
+            initial_backoff (float): First reconnect delay in seconds
+            max_backoff (float): Upper bound on the reconnect delay
+            on_connected (Callable): Called from the capture thread when the first
+                frame arrives after connecting
+        """
+        self.camera_url = camera_url
+        self.name = name
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.on_connected = on_connected
+        self.connected = False
+        self.outages = 0
+        self.reconnect_attempts = 0
+        self.total_outage_seconds = 0.0
+        self.last_outage_seconds = None
+        self._outage_started = time.monotonic()
+        self._frame = None
+        self._capture_ts = None
+        self._frame_number = 0
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def read(self, last_frame_number: int = 0, timeout: float = 1.0):
+        """
+        Wait for a frame newer than last_frame_number
+
+        Returns:
+            (frame, capture_ts, frame_number), with frame None if no new
+            frame arrived within the timeout
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._frame_number > last_frame_number or self._stop_event.is_set(),
+                timeout
+            )
+            if self._frame_number <= last_frame_number:
+                return None, None, last_frame_number
+            return self._frame, self._capture_ts, self._frame_number
+
+    def current_outage_seconds(self) -> float:
+        """How long the camera has been unavailable, 0 while connected"""
+        if self.connected:
+            return 0.0
+        return time.monotonic() - self._outage_started
+
+    def metrics(self) -> dict:
+        return {
+            "connected": self.connected,
+            "outages": self.outages,
+            "reconnect_attempts": self.reconnect_attempts,
+            "current_outage_s": round(self.current_outage_seconds(), 1),
+            "last_outage_s": None if self.last_outage_seconds is None else round(self.last_outage_seconds, 1),
+            "total_outage_s": round(self.total_outage_seconds, 1),
+        }
+
+    def _open(self):
+        camera = cv2.VideoCapture(self.camera_url)
+        if camera.isOpened():
+            return camera
+        camera.release()
+        return None
+
+    def _mark_connected(self):
+        outage = time.monotonic() - self._outage_started
+        self.connected = True
+        if self.outages:
+            self.last_outage_seconds = outage
+            self.total_outage_seconds += outage
+            logger.info(f"Camera {self.name} reconnected after {outage:.1f}s")
+        else:
+            logger.info(f"Successfully connected to camera {self.name}")
+        if self.on_connected is not None:
+            self.on_connected()
+
+    def _mark_disconnected(self):
+        self.connected = False
+        self.outages += 1
+        self._outage_started = time.monotonic()
+        logger.warning(f"Lost camera {self.name}, reconnecting in the background")
+
+    def _wait_backoff(self, backoff: float) -> float:
+        """Sleep for a jittered backoff delay and return the next backoff"""
+        delay = backoff * random.uniform(0.5, 1.5)
+        logger.debug(f"Camera {self.name} unavailable, retrying in {delay:.1f}s")
+        self._stop_event.wait(delay)
+        return min(self.max_backoff, backoff * 2)
+
+    def _capture_loop(self):
+        camera = None
+        backoff = self.initial_backoff
+        while not self._stop_event.is_set():
+            if camera is None:
+                self.reconnect_attempts += 1
+                try:
+                    camera = self._open()
+                except Exception as e:
+                    logger.error(f"Error connecting to camera {self.name}: {str(e)}")
+                    camera = None
+
+                if camera is None:
+                    backoff = self._wait_backoff(backoff)
+                    continue
+
+            ret, frame = camera.read()
+            if not ret:
+                camera.release()
+                camera = None
+                # Streams that open but never deliver a frame stay in the same outage
+                if self.connected:
+                    self._mark_disconnected()
+                backoff = self._wait_backoff(backoff)
+                continue
+
+            if not self.connected:
+                backoff = self.initial_backoff
+                self._mark_connected()
+
+            with self._condition:
+                self._frame = frame
+                self._capture_ts = time.monotonic()
+                self._frame_number += 1
+                self._condition.notify_all()
+
+        if camera is not None:
+            camera.release()
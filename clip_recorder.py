@@ -0,0 +1,182 @@
+import cv2
+import numpy as np
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ClipRecorder:
+    """
+    Event-triggered clip recording with pre-roll
+
+    Processed frames are copied into a preallocated ring buffer sized for
+    pre-roll plus post-roll. When a configured event fires, the clip goes
+    to a background writer thread straight away; it encodes the pre-roll
+    from the ring and then follows post-roll frames as they are pushed.
+    The vision loop never waits on encoding or disk I/O, and frames are
+    read in place rather than copied out per clip.
+    """
+
+    def __init__(self, output_dir: str = "clips", room: str = "room",
+                 pre_roll: float = 5.0, post_roll: float = 5.0, fps: int = 10,
+                 events: Sequence[str] = ("human_detected", "esp_on"),
+                 quiet_hours: Optional[Tuple[int, int]] = None,
+                 max_pending: int = 4, codec: str = "mp4v"):
+        """
+        Args:
+            output_dir (str): Directory clips are written to
+            room (str): Room name, used in clip file names
+            pre_roll (float): Seconds recorded before the event
+            post_roll (float): Seconds recorded after the last event
+            fps (int): Rate frames are pushed at, used to size the buffer
+            events (Sequence[str]): Events that start a clip: "human_detected"
+                (either transition), "esp_on", "esp_off"
+            quiet_hours (Tuple[int, int]): Only record between these local
+                hours, e.g. (20, 6); None records at any time
+            max_pending (int): Clips waiting for the writer before new ones are dropped
+            codec (str): FourCC passed to cv2.VideoWriter
+        """
+        self.output_dir = output_dir
+        self.room = room
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.events = set(events)
+        self.quiet_hours = quiet_hours
+        self.codec = codec
+        self.capacity = max(1, math.ceil((pre_roll + post_roll) * fps))
+        self.pre_frames = max(1, math.ceil(pre_roll * fps))
+        self.clips_written = 0
+        self.clips_dropped = 0
+        self._ring = None
+        self._seq = 0
+        self._active = None
+        # Guards ring slots between push() and the writer's copy of a frame
+        self._condition = threading.Condition()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _in_quiet_hours(self) -> bool:
+        if self.quiet_hours is None:
+            return True
+        start, end = self.quiet_hours
+        hour = datetime.now().hour
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def trigger(self, event: str) -> bool:
+        """Start or extend a clip if `event` is configured; never blocks"""
+        if event not in self.events or not self._in_quiet_hours() or self._ring is None:
+            return False
+
+        end_time = time.monotonic() + self.post_roll
+        if self._active is not None:
+            self._active["end_time"] = end_time
+            return True
+
+        # Pre-roll is whatever part of the last pre_roll seconds is buffered
+        clip = {"ring": self._ring, "start_seq": max(0, self._seq - self.pre_frames),
+                "end_seq": None, "end_time": end_time, "event": event, "started": datetime.now()}
+        try:
+            self._queue.put_nowait(clip)
+        except queue.Full:
+            self.clips_dropped += 1
+            logger.warning(f"Clip writer is behind, dropping clip for event {event}")
+            return False
+        self._active = clip
+        logger.info(f"Recording clip for event {event}")
+        return True
+
+    def push(self, frame: np.ndarray):
+        """Copy a processed frame into the ring buffer"""
+        if self._ring is None or self._ring.shape[1:] != frame.shape:
+            if self._active is not None:
+                self._finish(self._active)
+            # A clip still being written keeps its reference to the old ring
+            with self._condition:
+                self._ring = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+                self._seq = 0
+
+        with self._condition:
+            np.copyto(self._ring[self._seq % self.capacity], frame)
+            self._seq += 1
+            self._condition.notify_all()
+
+        active = self._active
+        if active is None:
+            return
+        full = self._seq - active["start_seq"] >= self.capacity
+        if full or time.monotonic() >= active["end_time"]:
+            self._finish(active)
+
+    def _finish(self, active):
+        self._active = None
+        with self._condition:
+            active["end_seq"] = self._seq
+            self._condition.notify_all()
+
+    def _read_frame(self, clip, seq, out):
+        """
+        Copy frame `seq` of a clip out of the ring into `out`, waiting for it
+        to be pushed. Returns False once the clip has ended, and raises if
+        the writer fell so far behind that the frame was overwritten.
+        """
+        with self._condition:
+            while True:
+                end_seq = clip["end_seq"]
+                if end_seq is not None and seq >= end_seq:
+                    return False
+                current = clip["ring"] is self._ring
+                if not current or seq < self._seq:
+                    break
+                self._condition.wait(timeout=1.0)
+            if current and seq < self._seq - self.capacity:
+                raise RuntimeError("clip writer fell behind the ring buffer")
+            np.copyto(out, clip["ring"][seq % self.capacity])
+            return True
+
+    def _write_loop(self):
+        frame = None
+        while True:
+            clip = self._queue.get()
+            if clip is None:
+                return
+            try:
+                # One scratch frame, reused until the frame size changes
+                if frame is None or frame.shape != clip["ring"].shape[1:]:
+                    frame = np.empty_like(clip["ring"][0])
+                self._write_clip(clip, frame)
+                self.clips_written += 1
+            except Exception as e:
+                self.clips_dropped += 1
+                logger.error(f"Failed to write clip: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _write_clip(self, clip, frame):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.room}_{clip['started']:%Y%m%d_%H%M%S}_{clip['event']}.mp4")
+        height, width = frame.shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.codec), self.fps, (width, height))
+        seq = clip["start_seq"]
+        try:
+            while self._read_frame(clip, seq, frame):
+                writer.write(frame)
+                seq += 1
+        finally:
+            writer.release()
+        logger.info(f"Wrote {seq - clip['start_seq']} frame clip to {path}")
+
+    def close(self):
+        """Flush an in-progress clip and wait for pending writes"""
+        if self._active is not None:
+            self._finish(self._active)
+        self._queue.put(None)
+        self._writer.join(timeout=30)
@@ -1,23 +1,34 @@
+import cv2
+import numpy as np
 import requests
 import time
+import json
+import math
 import logging
-from typing import Dict
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from camera_capture import CameraCapture
 
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class ESPCalibrator:
-    def __init__(self, esp_urls: Dict[int, str], delay: int = 3):
+    def __init__(self, esp_urls: Dict[int, str], delay: int = 3,
+                 grid_size: Tuple[int, int] = (2, 2)):
         """
         Initialize the ESP calibrator
         
         Args:
             esp_urls (Dict[int, str]): Dictionary mapping ESP numbers to their URLs
             delay (int): Delay in seconds between switching ESPs (default: 3)
+            grid_size (Tuple[int, int]): Grid layout as (rows, columns) (default: (2, 2))
         """
         self.esp_urls = esp_urls
         self.delay = delay
+        self.grid_size = grid_size
         
     def turn_all_off(self):
         """Turn off all ESP LEDs"""
@@ -72,16 +83,194 @@ class ESPCalibrator:
     def _get_grid_position(self, esp_num: int) -> str:
         """
         Convert ESP number to grid position
-        Grid is 3x2 (rows x columns), numbered like this:
+        Cells are numbered row by row, e.g. for a 3x2 grid:
         1 2
         3 4
         5 6
         """
-        row = (esp_num - 1) // 2
-        col = (esp_num - 1) % 2
+        columns = self.grid_size[1]
+        row = (esp_num - 1) // columns
+        col = (esp_num - 1) % columns
         return f"Row {row + 1}, Column {col + 1}"
 
+    def _send_states(self, states: Dict[int, bool], timeout: float = 3) -> None:
+        """Send on/off commands to several ESPs concurrently"""
+        def send(item):
+            esp_num, state = item
+            command = "on" if state else "off"
+            try:
+                requests.get(f"{self.esp_urls[esp_num]}/{command}", timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error communicating with ESP {esp_num}: {e}")
+
+        with ThreadPoolExecutor(max_workers=min(32, max(1, len(states)))) as pool:
+            list(pool.map(send, states.items()))
+
+    def _capture_gray(self, capture: CameraCapture, samples: int, not_before: float,
+                      timeout: float = 10.0) -> np.ndarray:
+        """Average grayscale frames captured after `not_before` to suppress sensor noise"""
+        deadline = not_before + timeout
+        total = None
+        count = 0
+        frame_number = 0
+        while count < samples:
+            frame, capture_ts, frame_number = capture.read(frame_number, timeout=1.0)
+            if frame is None:
+                if time.monotonic() > deadline:
+                    raise ConnectionError("Failed to read frames from camera during calibration")
+                continue
+            # Frames from before the LEDs settled still show the previous phase
+            if capture_ts < not_before:
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.float32)
+            total = gray if total is None else total + gray
+            count += 1
+        return total / count
+
+    def _cell_means(self, gray: np.ndarray) -> np.ndarray:
+        """Mean brightness of every grid cell, indexed like GridMotionDetector"""
+        rows, cols = self.grid_size
+        height, width = gray.shape[:2]
+        cell_height = height // rows
+        cell_width = width // cols
+        cells = gray[:cell_height * rows, :cell_width * cols]
+        cells = cells.reshape(rows, cell_height, cols, cell_width)
+        return cells.mean(axis=(1, 3)).reshape(-1)
+
+    def auto_calibrate(self, camera_url: str, config_path: str = "esp_mapping.json",
+                       settle: float = 1.0, samples: int = 3,
+                       min_brightness_delta: float = 8.0,
+                       allow_partial: bool = False) -> Dict[int, int]:
+        """
+        Map ESPs to grid cells automatically using the camera
+
+        Every ESP gets a distinct binary code. For each bit all ESPs are
+        switched concurrently: first the ESPs with the bit set are on and the
+        rest off, then the inverse. A cell whose brightness follows the same
+        pattern is lit by the ESP with that code, so calibration needs
+        2 * ceil(log2(n + 1)) captures instead of one flash per ESP.
+
+        Frames are read through a newest-frame-only CameraCapture, and only
+        frames captured `settle` seconds after a switch are used, however
+        fast the camera streams.
+
+        Args:
+            camera_url (str): Camera stream URL, same as GridMotionDetector
+            config_path (str): Where to write the resulting mapping
+            settle (float): Seconds to wait for relays/LEDs after each switch
+            samples (int): Frames averaged per capture
+            min_brightness_delta (float): Minimum mean brightness change for a
+                cell to count as lit in every phase
+            allow_partial (bool): Write the mapping even if some ESPs were not
+                found; an empty mapping is never written
+
+        Returns:
+            Dict[int, int]: Mapping of grid cell index to ESP number
+        """
+        esp_nums = sorted(self.esp_urls)
+        codes = {esp_num: index + 1 for index, esp_num in enumerate(esp_nums)}
+        by_code = {code: esp_num for esp_num, code in codes.items()}
+        bits = max(1, math.ceil(math.log2(len(esp_nums) + 1)))
+
+        capture = CameraCapture(camera_url, name="calibration")
+        capture.start()
+
+        logger.info(f"Auto-calibrating {len(esp_nums)} ESPs with {bits} bit patterns")
+        try:
+            deltas = []
+            for bit in range(bits):
+                pattern = {esp_num: bool(codes[esp_num] >> bit & 1) for esp_num in esp_nums}
+                inverse = {esp_num: not state for esp_num, state in pattern.items()}
+
+                self._send_states(pattern)
+                lit = self._cell_means(self._capture_gray(capture, samples, time.monotonic() + settle))
+
+                self._send_states(inverse)
+                unlit = self._cell_means(self._capture_gray(capture, samples, time.monotonic() + settle))
+
+                deltas.append(lit - unlit)
+        finally:
+            capture.stop()
+            self.turn_all_off()
+
+        deltas = np.stack(deltas)  # shape: (bits, cells)
+        weights = 1 << np.arange(bits)
+        decoded = ((deltas > 0).astype(np.int64) * weights[:, None]).sum(axis=0)
+        confident = np.abs(deltas).min(axis=0) >= min_brightness_delta
+
+        cell_to_esp = {}
+        for cell, (code, ok) in enumerate(zip(decoded, confident)):
+            esp_num = by_code.get(int(code))
+            if ok and esp_num is not None:
+                cell_to_esp[cell] = esp_num
+                logger.info(f"Cell {cell} ({self._get_grid_position(cell + 1)}) -> ESP {esp_num}")
+
+        unmapped = [esp_num for esp_num in esp_nums if esp_num not in cell_to_esp.values()]
+        if unmapped:
+            logger.warning(f"No grid cell responded to ESPs: {unmapped}")
+
+        # A failed run must not replace a good mapping from an earlier one
+        if not cell_to_esp or (unmapped and not allow_partial):
+            logger.error(f"Calibration incomplete, leaving {config_path} unchanged "
+                         f"(use --allow-partial to write a partial mapping)")
+            return cell_to_esp
+
+        save_esp_mapping(config_path, self.grid_size, cell_to_esp)
+        logger.info(f"Wrote ESP mapping for {len(cell_to_esp)} cells to {config_path}")
+        return cell_to_esp
+
+
+def save_esp_mapping(path: str, grid_size: Tuple[int, int], cell_to_esp: Dict[int, int]) -> None:
+    """Write a cell to ESP mapping in the format read by load_esp_mapping"""
+    esp_cells: Dict[int, List[int]] = {}
+    for cell, esp_num in sorted(cell_to_esp.items()):
+        esp_cells.setdefault(esp_num, []).append(cell)
+
+    config = {
+        "grid_size": list(grid_size),
+        "cell_to_esp": {str(cell): esp_num for cell, esp_num in sorted(cell_to_esp.items())},
+        "esp_cells": {str(esp_num): cells for esp_num, cells in sorted(esp_cells.items())},
+    }
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def load_esp_mapping(path: str, grid_size: Optional[Tuple[int, int]] = None) -> Optional[Dict[int, int]]:
+    """
+    Read a cell to ESP mapping written by auto_calibrate, or None if absent
+
+    If grid_size is given and the mapping was calibrated for a different
+    grid, it is ignored with a warning, since its cell numbers would point
+    at the wrong parts of the frame.
+    """
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    saved_grid = tuple(config.get("grid_size", ()))
+    if grid_size is not None and saved_grid != tuple(grid_size):
+        logger.warning(f"Ignoring ESP mapping in {path}: calibrated for a {saved_grid} grid, "
+                       f"not {tuple(grid_size)}. Re-run calibration with --auto --grid.")
+        return None
+    return {int(cell): int(esp_num) for cell, esp_num in config["cell_to_esp"].items()}
+
+
 def main():
+    parser = argparse.ArgumentParser(description="ESP calibration sequencing")
+    parser.add_argument("--auto", action="store_true",
+                        help="Map ESPs to grid cells automatically using the camera")
+    parser.add_argument("--camera", default="http://192.168.137.179:4747/video",
+                        help="Camera stream URL used for automatic calibration")
+    parser.add_argument("--grid", type=int, nargs=2, default=(2, 2), metavar=("ROWS", "COLS"),
+                        help="Grid layout (default: 2 2)")
+    parser.add_argument("--output", default="esp_mapping.json",
+                        help="Mapping file written by automatic calibration")
+    parser.add_argument("--allow-partial", action="store_true",
+                        help="Write the mapping even if some ESPs were not found")
+    args = parser.parse_args()
+
     # Configuration (using the same ESP URLs from your main script)
     ESP_URLS = {
         1: "http://192.168.137.101",
@@ -90,8 +279,11 @@ def main():
         4: "http://192.168.137.104",  
     }
     # Create and run calibrator
-    calibrator = ESPCalibrator(ESP_URLS, delay=3)
-    calibrator.calibrate()
+    calibrator = ESPCalibrator(ESP_URLS, delay=3, grid_size=tuple(args.grid))
+    if args.auto:
+        calibrator.auto_calibrate(args.camera, config_path=args.output, allow_partial=args.allow_partial)
+    else:
+        calibrator.calibrate()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
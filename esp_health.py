@@ -0,0 +1,208 @@
+import requests
+import threading
+import time
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Per-device circuit breaker: closed -> open after N failures -> half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures before the breaker opens
+            reset_timeout (float): Seconds an open breaker waits before a half-open probe
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def allow_request(self) -> bool:
+        """Only closed breakers let commands through; probes handle the rest"""
+        return self.state == self.CLOSED
+
+    def ready_for_probe(self, now: float) -> bool:
+        """Whether an open breaker has waited long enough to be probed"""
+        return self.state == self.OPEN and now - self.opened_at >= self.reset_timeout
+
+    def record_success(self) -> bool:
+        """Reset the breaker, returning True if it was not already closed"""
+        recovered = self.state != self.CLOSED
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        return recovered
+
+    def record_failure(self, now: float) -> bool:
+        """Count a failure, returning True if the breaker just opened"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = now
+            return True
+        return False
+
+
+class ESPDevice:
+    """Health and cached state of a single ESP8266"""
+
+    def __init__(self, esp_number: int, url: str, breaker: CircuitBreaker):
+        self.esp_number = esp_number
+        self.url = url
+        self.breaker = breaker
+        self.last_known_state = None
+        self.desired_state = None
+        self.last_seen = None
+        self.last_error = None
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "health": self.breaker.state,
+            "failures": self.breaker.failures,
+            "last_known_state": self.last_known_state,
+            "desired_state": self.desired_state,
+            "last_seen": self.last_seen,
+            "last_error": self.last_error,
+        }
+
+
+class ESPDeviceRegistry:
+    """Tracks ESP health with circuit breakers and background health probes"""
+
+    def __init__(self, esp_urls: Dict[int, str], failure_threshold: int = 3,
+                 reset_timeout: float = 30.0, probe_interval: float = 10.0,
+                 probe_timeout: float = 0.5,
+                 on_recovered: Optional[Callable[[int, Optional[bool]], None]] = None,
+                 probe: Optional[Callable[[str], Tuple[bool, Optional[str]]]] = None):
+        """
+        Args:
+            esp_urls (Dict[int, str]): Dictionary mapping ESP numbers to their URLs
+            failure_threshold (int): Consecutive failures before a device is marked dead
+            reset_timeout (float): Seconds before a dead device is probed again
+            probe_interval (float): Seconds between background health probe rounds
+            probe_timeout (float): Timeout for a single health probe request
+            on_recovered (Callable): Called with (esp_number, desired_state) when a
+                dead device answers again, so its state can be restored
+            probe (Callable): Returns (ok, error) for a device URL; defaults to
+                an HTTP GET where any response counts as alive
+        """
+        self.devices = {
+            esp_number: ESPDevice(esp_number, url, CircuitBreaker(failure_threshold, reset_timeout))
+            for esp_number, url in esp_urls.items()
+        }
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.on_recovered = on_recovered
+        self.probe = probe or self._http_probe
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._probe_thread = None
+
+    def start(self):
+        """Start background health probes"""
+        if self._probe_thread is not None:
+            return
+        self._stop_event.clear()
+        self._probe_thread = threading.Thread(target=self._probe_loop, daemon=True)
+        self._probe_thread.start()
+
+    def stop(self):
+        """Stop background health probes"""
+        self._stop_event.set()
+        if self._probe_thread is not None:
+            self._probe_thread.join(timeout=self.probe_timeout + 1)
+            self._probe_thread = None
+
+    def allow(self, esp_number: int) -> bool:
+        """Whether a command to this device should be attempted at all"""
+        with self._lock:
+            device = self.devices.get(esp_number)
+            return device is not None and device.breaker.allow_request()
+
+    def set_desired(self, esp_number: int, state: bool):
+        """Remember the state the device should be in, even if it is unreachable"""
+        with self._lock:
+            if esp_number in self.devices:
+                self.devices[esp_number].desired_state = bool(state)
+
+    def record_success(self, esp_number: int, state: Optional[bool] = None):
+        """Record a successful command or probe"""
+        with self._lock:
+            device = self.devices[esp_number]
+            recovered = device.breaker.record_success()
+            device.last_seen = time.time()
+            device.last_error = None
+            if state is not None:
+                device.last_known_state = bool(state)
+        if recovered:
+            logger.info(f"ESP {esp_number} is reachable again")
+        return recovered
+
+    def record_failure(self, esp_number: int, error: str):
+        """Record a failed command or probe"""
+        with self._lock:
+            device = self.devices[esp_number]
+            device.last_error = error
+            opened = device.breaker.record_failure(time.monotonic())
+            if opened:
+                # A board that drops off the network may reboot with its relay off
+                device.last_known_state = None
+        if opened:
+            logger.warning(f"ESP {esp_number} marked unreachable, commands will fail fast: {error}")
+        return opened
+
+    def snapshot(self) -> Dict[int, dict]:
+        """Health of every device, for the status endpoint"""
+        with self._lock:
+            return {esp_number: device.to_dict() for esp_number, device in self.devices.items()}
+
+    def _http_probe(self, url: str) -> Tuple[bool, Optional[str]]:
+        """Any HTTP response means the board is alive"""
+        try:
+            requests.get(url, timeout=self.probe_timeout)
+        except requests.exceptions.RequestException as e:
+            return False, str(e)
+        return True, None
+
+    def _probe(self, device: ESPDevice):
+        """Probe one device and re-send its desired state if it just recovered"""
+        ok, error = self.probe(device.url)
+        if not ok:
+            self.record_failure(device.esp_number, error)
+            return
+
+        if self.record_success(device.esp_number):
+            with self._lock:
+                desired = device.desired_state
+            if desired is not None and self.on_recovered is not None:
+                self.on_recovered(device.esp_number, desired)
+
+    def _probe_loop(self):
+        """Probe healthy devices and dead devices whose reset timeout has passed"""
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = []
+                for device in self.devices.values():
+                    if device.breaker.ready_for_probe(now):
+                        device.breaker.state = CircuitBreaker.HALF_OPEN
+                        due.append(device)
+                    elif device.breaker.state == CircuitBreaker.CLOSED:
+                        due.append(device)
+
+            for device in due:
+                if self._stop_event.is_set():
+                    break
+                self._probe(device)
+
+            self._stop_event.wait(self.probe_interval)
@@ -0,0 +1,570 @@
+import cv2
+import numpy as np
+import argparse
+import logging
+import math
+import random
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ESP_PATH = re.compile(r"^/esp/(\d+)(?:/(on|off|ping))?/?$")
+# Frame rate of the DroidCam stream the classroom setup uses
+DROIDCAM_FPS = 30
+
+
+class SimulatedESPFleet:
+    """Hundreds of fake ESP8266 endpoints answering /on and /off over HTTP and UDP"""
+
+    def __init__(self, count: int, latency: float = 0.02, jitter: float = 0.01,
+                 loss_rate: float = 0.0, failure_rate: float = 0.0,
+                 loss_hold: float = 1.0, host: str = "127.0.0.1", seed: int = 0):
+        """
+        Args:
+            count (int): Number of simulated ESPs, numbered from 1
+            latency (float): Base response latency in seconds
+            jitter (float): Uniform random extra latency in seconds
+            loss_rate (float): Fraction of commands that never get a response
+            failure_rate (float): Fraction of commands answered with HTTP 500
+            loss_hold (float): Seconds a lost HTTP request is held before the
+                connection is dropped
+            host (str): Interface to bind the HTTP and UDP servers to
+            seed (int): Seed for latency, loss and failure sampling
+        """
+        self.count = count
+        self.latency = latency
+        self.jitter = jitter
+        self.loss_rate = loss_rate
+        self.failure_rate = failure_rate
+        self.loss_hold = loss_hold
+        self.host = host
+        self.states = {esp_num: False for esp_num in range(1, count + 1)}
+        self.commands: List[Tuple[float, int, str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lost = 0
+        self.failed = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._http_server = None
+        self._udp_socket = None
+        self._udp_pool = None
+        self._threads = []
+        self._running = False
+
+    @property
+    def http_port(self) -> int:
+        return self._http_server.server_address[1]
+
+    @property
+    def udp_port(self) -> int:
+        return self._udp_socket.getsockname()[1]
+
+    def esp_urls(self, scheme: str = "http") -> Dict[int, str]:
+        """ESP URLs for GridMotionDetector/ESPCalibrator using the http or udp scheme"""
+        port = self.http_port if scheme == "http" else self.udp_port
+        return {esp_num: f"{scheme}://{self.host}:{port}/esp/{esp_num}"
+                for esp_num in range(1, self.count + 1)}
+
+    def start(self):
+        """Start the HTTP and UDP servers in background threads"""
+        fleet = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status = fleet.handle(self.path)
+                if status is None:
+                    self.close_connection = True
+                    return
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._running = True
+        self._http_server = ThreadingHTTPServer((self.host, 0), Handler)
+        self._http_server.daemon_threads = True
+        self._http_server.request_queue_size = 1024
+
+        self._udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._udp_socket.bind((self.host, 0))
+        self._udp_socket.settimeout(0.2)
+        self._udp_pool = ThreadPoolExecutor(max_workers=64)
+
+        self._threads = [
+            threading.Thread(target=self._http_server.serve_forever, daemon=True),
+            threading.Thread(target=self._udp_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Simulated {self.count} ESPs on http port {self.http_port}, udp port {self.udp_port}")
+
+    def stop(self):
+        """Stop both servers"""
+        self._running = False
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._udp_pool.shutdown(wait=False)
+        self._udp_socket.close()
+
+    def handle(self, path: str) -> Optional[int]:
+        """Apply one request; returns the HTTP status or None if it was lost"""
+        match = ESP_PATH.match(path)
+        if match is None or int(match.group(1)) not in self.states:
+            return 404
+
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            roll = self._random.random()
+
+        try:
+            time.sleep(delay)
+            command = match.group(2)
+            # Health probes (bare device URL or UDP ping) are never lost
+            if command is None or command == "ping":
+                return 200
+            if roll < self.loss_rate:
+                with self._lock:
+                    self.lost += 1
+                time.sleep(self.loss_hold)
+                return None
+            if roll < self.loss_rate + self.failure_rate:
+                with self._lock:
+                    self.failed += 1
+                return 500
+
+            esp_num = int(match.group(1))
+            with self._lock:
+                self.states[esp_num] = command == "on"
+                self.commands.append((time.monotonic(), esp_num, command))
+            return 200
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _udp_loop(self):
+        while self._running:
+            try:
+                data, address = self._udp_socket.recvfrom(512)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._udp_pool.submit(self._handle_datagram, data, address)
+
+    def _handle_datagram(self, data, address):
+        try:
+            seq, path, command = data.decode().split()
+        except ValueError:
+            return
+        status = self.handle(f"{path}/{command}")
+        if status == 200:
+            try:
+                self._udp_socket.sendto(f"{seq} ack".encode(), address)
+            except OSError:
+                pass
+
+
+class SyntheticCamera:
+    """MJPEG stream of synthetic people walking across a room, served over HTTP"""
+
+    def __init__(self, grid_size: Tuple[int, int], size: Tuple[int, int] = (960, 540),
+                 fps: int = 30, people: int = 6, pattern: str = "walk",
+                 fleet: Optional[SimulatedESPFleet] = None,
+                 esp_to_cell: Optional[Dict[int, int]] = None,
+                 host: str = "127.0.0.1", seed: int = 0):
+        """
+        Args:
+            grid_size (Tuple[int, int]): Grid layout used to record cell entries
+            size (Tuple[int, int]): Frame (width, height)
+            fps (int): Frames generated per second
+            people (int): Number of simulated people
+            pattern (str): "walk" for steady motion, "burst" for groups that
+                arrive and leave together, "empty" for an empty room
+            fleet (SimulatedESPFleet): If given, cells of ESPs that are on are
+                drawn brighter, so ESPCalibrator can be run against the fleet
+            esp_to_cell (Dict[int, int]): Which cell each ESP lights; defaults
+                to ESP number - 1
+            host (str): Interface to serve the stream on
+            seed (int): Seed for the motion pattern
+        """
+        self.grid_size = grid_size
+        self.width, self.height = size
+        self.fps = fps
+        self.pattern = pattern
+        self.fleet = fleet
+        self.esp_to_cell = esp_to_cell or {}
+        self.host = host
+        self.entries: List[Tuple[float, int]] = []
+        # Frame numbers sent on each /video connection, in order
+        self.streams: List[List[int]] = []
+        self._random = np.random.default_rng(seed)
+        self._positions = self._random.uniform((0, 0), (self.width, self.height), size=(people, 2))
+        self._velocities = self._random.uniform(-6, 6, size=(people, 2))
+        self._occupied = set()
+        self._jpeg = None
+        self._frame_number = 0
+        self._condition = threading.Condition()
+        self._server = None
+        self._threads = []
+        self._running = False
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self._server.server_address[1]}/video"
+
+    def start(self):
+        """Start generating frames and serving them at `url`"""
+        camera = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/video":
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                sent = []
+                camera.streams.append(sent)
+                last = 0
+                try:
+                    while camera._running:
+                        number, jpeg = camera.wait_frame(last)
+                        if jpeg is None or number == last:
+                            continue
+                        last = number
+                        sent.append(number)
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+                        self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg + b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self._running = True
+        self._server = ThreadingHTTPServer((self.host, 0), Handler)
+        self._server.daemon_threads = True
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, daemon=True),
+            threading.Thread(target=self._generate_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Synthetic camera streaming at {self.url}")
+
+    def stop(self):
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=1)
+
+    def wait_frame(self, last: int, timeout: float = 1.0):
+        """Block until a frame newer than `last` exists; returns (number, jpeg)"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._frame_number > last or not self._running, timeout)
+            return self._frame_number, self._jpeg
+
+    def _step(self):
+        """Advance people according to the motion pattern"""
+        if self.pattern == "empty":
+            self._positions[:] = -1000
+            return
+        if self.pattern == "burst":
+            # Everyone enters for ten seconds, then the room stays empty for ten
+            if int(time.monotonic() // 10) % 2:
+                self._positions[:] = -1000
+                return
+            outside = self._positions[:, 0] < 0
+            if outside.any():
+                self._positions[outside] = self._random.uniform(
+                    (0, 0), (self.width, self.height), size=(outside.sum(), 2))
+
+        self._positions += self._velocities
+        for axis, limit in ((0, self.width), (1, self.height)):
+            bounce = (self._positions[:, axis] < 0) | (self._positions[:, axis] > limit)
+            self._velocities[bounce, axis] *= -1
+            np.clip(self._positions[:, axis], 0, limit, out=self._positions[:, axis])
+
+    def _cell_of(self, x: float, y: float) -> Optional[int]:
+        rows, cols = self.grid_size
+        if x < 0 or y < 0:
+            return None
+        row = min(int(y * rows / self.height), rows - 1)
+        col = min(int(x * cols / self.width), cols - 1)
+        return row * cols + col
+
+    def _render(self) -> np.ndarray:
+        frame = np.full((self.height, self.width, 3), 40, dtype=np.uint8)
+        rows, cols = self.grid_size
+        cell_height = self.height // rows
+        cell_width = self.width // cols
+
+        if self.fleet is not None:
+            for esp_num, state in list(self.fleet.states.items()):
+                if not state:
+                    continue
+                cell = self.esp_to_cell.get(esp_num, esp_num - 1)
+                row, col = divmod(cell, cols)
+                frame[row * cell_height:(row + 1) * cell_height,
+                      col * cell_width:(col + 1) * cell_width] = 120
+
+        for x, y in self._positions:
+            if x < 0:
+                continue
+            cv2.rectangle(frame, (int(x) - 12, int(y) - 30), (int(x) + 12, int(y) + 30), (200, 180, 160), -1)
+        return frame
+
+    def _generate_loop(self):
+        interval = 1 / self.fps
+        while self._running:
+            started = time.monotonic()
+            self._step()
+
+            occupied = {self._cell_of(x, y) for x, y in self._positions} - {None}
+            for cell in occupied - self._occupied:
+                self.entries.append((started, cell))
+            self._occupied = occupied
+
+            ok, jpeg = cv2.imencode(".jpg", self._render(), [cv2.IMWRITE_JPEG_QUALITY, 80])
+            if ok:
+                with self._condition:
+                    self._jpeg = jpeg.tobytes()
+                    self._frame_number += 1
+                    self._condition.notify_all()
+
+            time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+def summarize_load_test(fleet: SimulatedESPFleet, camera: SyntheticCamera,
+                        duration: float, cell_to_esp: Optional[Dict[int, int]] = None,
+                        frame_lags: Optional[List[int]] = None,
+                        dispatches: Optional[List[dict]] = None) -> dict:
+    """
+    Command throughput, occupancy-to-light latency and backlog for a finished run
+
+    Backlog is reported two ways: frame_lags, how many frames the camera had
+    generated past each processed frame, and dispatches, the commands queued,
+    re-sent and left unconfirmed by each send_esp_commands call.
+    """
+    cell_to_esp = cell_to_esp or {}
+    esp_to_cells: Dict[int, List[int]] = {}
+    for cell in range(camera.grid_size[0] * camera.grid_size[1]):
+        esp_to_cells.setdefault(cell_to_esp.get(cell, cell + 1), []).append(cell)
+
+    # Each "on" is attributed to the latest entry into one of that ESP's cells
+    latencies = []
+    for sent_at, esp_num, command in fleet.commands:
+        if command != "on":
+            continue
+        cells = esp_to_cells.get(esp_num, [])
+        entered = [t for t, cell in camera.entries if cell in cells and t <= sent_at]
+        if entered:
+            latencies.append(sent_at - max(entered))
+
+    report = {
+        "duration_s": round(duration, 2),
+        "commands": len(fleet.commands),
+        "commands_per_s": round(len(fleet.commands) / duration, 2) if duration else 0.0,
+        "lost": fleet.lost,
+        "failed": fleet.failed,
+        "max_in_flight": fleet.max_in_flight,
+        "latency_samples": len(latencies),
+    }
+    if frame_lags:
+        lag_p50, lag_p95 = np.percentile(frame_lags, [50, 95])
+        report.update({
+            "frame_lag_p50": round(float(lag_p50), 1),
+            "frame_lag_p95": round(float(lag_p95), 1),
+            "frame_lag_max": max(frame_lags),
+        })
+    if dispatches:
+        retried = [sum(d["rounds"][1:]) for d in dispatches]
+        pending = [d["pending"] for d in dispatches]
+        report.update({
+            "dispatches": len(dispatches),
+            "commands_per_dispatch": round(sum(d["queued"] for d in dispatches) / len(dispatches), 2),
+            "retried_per_dispatch": round(sum(retried) / len(dispatches), 2),
+            "retried_max": max(retried),
+            "pending_after_dispatch": sum(pending),
+            "pending_max": max(pending),
+        })
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        report.update({
+            "latency_p50_ms": round(p50 * 1000, 1),
+            "latency_p95_ms": round(p95 * 1000, 1),
+            "latency_p99_ms": round(p99 * 1000, 1),
+            "latency_max_ms": round(max(latencies) * 1000, 1),
+        })
+    return report
+
+
+def _grid_for(count: int) -> Tuple[int, int]:
+    """Most square (rows, columns) layout with exactly `count` cells"""
+    rows = int(math.sqrt(count))
+    while count % rows:
+        rows -= 1
+    return rows, count // rows
+
+
+def run_load_test(args):
+    """Drive GridMotionDetector against the simulated fleet and camera"""
+    from main import GridMotionDetector
+    from esp_transport import create_transport
+
+    grid_size = _grid_for(args.devices)
+    fleet = SimulatedESPFleet(args.devices, latency=args.latency, jitter=args.jitter,
+                              loss_rate=args.loss, failure_rate=args.failure)
+    fleet.start()
+    camera = SyntheticCamera(grid_size, fps=args.fps, people=args.people, pattern=args.pattern)
+    camera.start()
+
+    detector = GridMotionDetector(
+        camera_url=camera.url,
+        esp_urls=fleet.esp_urls("udp" if args.transport == "udp" else "http"),
+        grid_size=grid_size,
+        min_activity_threshold=1000,
+        fps_limit=args.fps,
+        max_retries=3,
+        transport=create_transport(args.transport),
+    )
+
+    # Count the commands each dispatch queues, sends per retry round and leaves unconfirmed
+    dispatches = []
+    current = threading.local()
+    send_many = detector.transport.send_many
+    send_esp_commands = detector.send_esp_commands
+
+    def counting_send_many(commands):
+        dispatch = getattr(current, "dispatch", None)
+        if dispatch is not None:
+            dispatch["rounds"].append(len(commands))
+        return send_many(commands)
+
+    def counting_send_esp_commands(states):
+        dispatch = {"queued": len(states), "rounds": [], "pending": 0}
+        current.dispatch = dispatch
+        try:
+            results = send_esp_commands(states)
+        finally:
+            current.dispatch = None
+        dispatch["pending"] = sum(1 for ok in results.values() if not ok)
+        dispatches.append(dispatch)
+        return results
+
+    detector.transport.send_many = counting_send_many
+    detector.send_esp_commands = counting_send_esp_commands
+
+    # Frames come through the detector's own newest-frame-only capture and
+    # are stamped by it, exactly as in GridMotionDetector.run
+    detector.capture.start()
+    started = time.monotonic()
+    processed = []
+    frame_number = 0
+    try:
+        while time.monotonic() - started < args.duration:
+            frame, capture_ts, frame_number = detector.capture.read(frame_number, timeout=1.0)
+            if frame is None:
+                continue
+            processed.append((frame_number, camera._frame_number))
+            detector.process_frame(frame, capture_ts)
+            time.sleep(1 / detector.fps_limit)
+    finally:
+        duration = time.monotonic() - started
+        detector.capture.stop()
+        detector.transport.close()
+        camera.stop()
+        fleet.stop()
+
+    # The capture's Nth frame is the Nth frame sent on its connection
+    stream = max(camera.streams, key=len, default=[])
+    frame_lags = [latest - stream[number - 1] for number, latest in processed if number <= len(stream)]
+
+    report = summarize_load_test(fleet, camera, duration, frame_lags=frame_lags, dispatches=dispatches)
+    report["frames_generated"] = camera._frame_number
+    report["frames_captured"] = frame_number
+    report["frames_processed"] = len(processed)
+    report["grid_size"] = list(grid_size)
+    report["transport"] = args.transport
+    report["stage_latency"] = detector.latency_tracer.summary()["stages"]
+    return report
+
+
+def run_calibration_check(args):
+    """
+    Run ESPCalibrator.auto_calibrate with its default settle time against a
+    shuffled simulated room, at --fps and at DroidCam's 30 fps
+    """
+    from esp_calibration import ESPCalibrator
+
+    grid_size = _grid_for(args.devices)
+    cells = list(range(args.devices))
+    random.Random(0).shuffle(cells)
+    esp_to_cell = {esp_num: cell for esp_num, cell in zip(range(1, args.devices + 1), cells)}
+
+    report = {"devices": args.devices}
+    for fps in sorted({args.fps, DROIDCAM_FPS}):
+        fleet = SimulatedESPFleet(args.devices, latency=args.latency, jitter=args.jitter)
+        fleet.start()
+        camera = SyntheticCamera(grid_size, fps=fps, pattern="empty", fleet=fleet, esp_to_cell=esp_to_cell)
+        camera.start()
+        try:
+            calibrator = ESPCalibrator(fleet.esp_urls(), grid_size=grid_size)
+            cell_to_esp = calibrator.auto_calibrate(camera.url, config_path=args.output)
+        finally:
+            camera.stop()
+            fleet.stop()
+
+        correct = sum(1 for esp_num, cell in esp_to_cell.items() if cell_to_esp.get(cell) == esp_num)
+        report[f"correctly_mapped_{fps}fps"] = correct
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated ESP8266 fleet and synthetic camera for load testing")
+    parser.add_argument("--devices", type=int, default=200, help="Number of simulated ESPs")
+    parser.add_argument("--duration", type=float, default=30, help="Load test duration in seconds")
+    parser.add_argument("--latency", type=float, default=0.02, help="Base ESP response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Random extra ESP latency in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="Fraction of commands never answered")
+    parser.add_argument("--failure", type=float, default=0.0, help="Fraction of commands answered with HTTP 500")
+    parser.add_argument("--people", type=int, default=12, help="Number of synthetic people")
+    parser.add_argument("--pattern", choices=["walk", "burst", "empty"], default="walk",
+                        help="Synthetic motion pattern")
+    parser.add_argument("--fps", type=int, default=10, help="Synthetic camera frame rate")
+    parser.add_argument("--transport", choices=["http", "aiohttp", "udp"], default="http",
+                        help="ESP transport under test")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Check ESPCalibrator.auto_calibrate against the simulator instead")
+    parser.add_argument("--output", default="esp_mapping_simulated.json",
+                        help="Mapping file written by --calibrate")
+    args = parser.parse_args()
+
+    report = run_calibration_check(args) if args.calibrate else run_load_test(args)
+    print("\n=== Load Test Report ===" if not args.calibrate else "\n=== Calibration Check ===")
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import abc
+import asyncio
+import itertools
+import logging
+import select
+import socket
+import threading
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed for AsyncHTTPTransport
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# (success, error message) for a single command attempt
+SendResult = Tuple[bool, Optional[str]]
+
+
+class ESPTransport(abc.ABC):
+    """Interface for delivering on/off commands to ESP8266 devices"""
+
+    timeout = 0.5
+
+    def probe(self, url: str) -> SendResult:
+        """Check that a device is reachable; any HTTP response counts"""
+        try:
+            requests.get(url, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return False, str(e)
+        return True, None
+
+    @abc.abstractmethod
+    def send(self, url: str, command: str) -> SendResult:
+        """Send one command, making a single attempt"""
+
+    def send_many(self, commands: List[Tuple[str, str]]) -> List[SendResult]:
+        """Send several (url, command) pairs, returning results in the same order"""
+        return [self.send(url, command) for url, command in commands]
+
+    def close(self):
+        """Release sockets, sessions and threads"""
+
+
+class HTTPTransport(ESPTransport):
+    """Blocking HTTP GET per command, one device at a time"""
+
+    def __init__(self, timeout: float = 0.5):
+        self.timeout = timeout
+
+    def send(self, url: str, command: str) -> SendResult:
+        try:
+            response = requests.get(f"{url}/{command}", timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return False, str(e)
+
+        if response.status_code == 200:
+            return True, None
+        return False, f"HTTP {response.status_code}"
+
+
+class AsyncHTTPTransport(ESPTransport):
+    """HTTP commands driven concurrently from one asyncio event loop"""
+
+    def __init__(self, timeout: float = 0.5, max_connections: int = 256):
+        """
+        Args:
+            timeout (float): Total timeout for each request
+            max_connections (int): Upper bound on simultaneous connections
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncHTTPTransport requires aiohttp (pip install aiohttp)")
+
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._session = self._run(self._create_session(max_connections))
+
+    def _run(self, coroutine):
+        """Run a coroutine on the transport's loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _create_session(self, max_connections):
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def _get(self, url, command):
+        try:
+            async with self._session.get(f"{url}/{command}") as response:
+                if response.status == 200:
+                    return True, None
+                return False, f"HTTP {response.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return False, str(e) or type(e).__name__
+
+    async def _gather(self, commands):
+        return await asyncio.gather(*(self._get(url, command) for url, command in commands))
+
+    def send(self, url: str, command: str) -> SendResult:
+        return self.send_many([(url, command)])[0]
+
+    def send_many(self, commands: List[Tuple[str, str]]) -> List[SendResult]:
+        if not commands:
+            return []
+        return list(self._run(self._gather(commands)))
+
+    def close(self):
+        try:
+            self._run(self._session.close())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=1)
+
+
+class UDPTransport(ESPTransport):
+    """
+    Fire-and-forget datagram commands with acknowledgements
+
+    Each command is sent as "<seq> <path> <command>" to the device's host on
+    `port` (or the port of a udp:// URL) and is acknowledged with
+    "<seq> ack". Commands without an ack are retransmitted.
+    """
+
+    def __init__(self, timeout: float = 0.5, retransmits: int = 2, port: int = 4210):
+        """
+        Args:
+            timeout (float): Seconds to wait for acks before retransmitting
+            retransmits (int): Extra transmissions for unacknowledged commands
+            port (int): UDP port for devices configured with http:// URLs
+        """
+        self.timeout = timeout
+        self.retransmits = retransmits
+        self.port = port
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _address(self, url):
+        parsed = urlparse(url)
+        port = parsed.port if parsed.scheme == "udp" and parsed.port else self.port
+        return (parsed.hostname, port), parsed.path or "/"
+
+    def probe(self, url: str) -> SendResult:
+        """Devices acknowledge a "ping" command without changing state"""
+        # A separate socket keeps slow probes from holding up commands
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            return self._exchange(sock, [(url, "ping")])[0]
+
+    def send(self, url: str, command: str) -> SendResult:
+        return self.send_many([(url, command)])[0]
+
+    def send_many(self, commands: List[Tuple[str, str]]) -> List[SendResult]:
+        with self._lock:
+            return self._exchange(self._sock, commands)
+
+    def _exchange(self, sock, commands):
+        """Send commands on `sock`, retransmitting until acked or out of attempts"""
+        results = [(False, "no ack")] * len(commands)
+        pending = {}
+        for index, (url, command) in enumerate(commands):
+            address, path = self._address(url)
+            seq = next(self._seq)
+            pending[seq] = (index, address, f"{seq} {path} {command}".encode())
+
+        for _ in range(self.retransmits + 1):
+            for seq, (index, address, payload) in pending.items():
+                try:
+                    sock.sendto(payload, address)
+                except OSError as e:
+                    results[index] = (False, str(e))
+
+            self._collect_acks(sock, pending, results)
+            if not pending:
+                break
+
+        return results
+
+    def _collect_acks(self, sock, pending, results):
+        """Read acks until all commands are acknowledged or the timeout expires"""
+        deadline = time.monotonic() + self.timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([sock], [], [], remaining)
+            if not ready:
+                break
+            try:
+                data, _ = sock.recvfrom(512)
+                seq, reply = data.split()[:2]
+                seq = int(seq)
+            except (OSError, ValueError):
+                continue
+            if reply == b"ack" and seq in pending:
+                index = pending.pop(seq)[0]
+                results[index] = (True, None)
+
+    def close(self):
+        self._sock.close()
+
+
+def create_transport(name: str = "http", timeout: float = 0.5) -> ESPTransport:
+    """Build a transport by name: http, aiohttp or udp"""
+    transports = {
+        "http": HTTPTransport,
+        "aiohttp": AsyncHTTPTransport,
+        "udp": UDPTransport,
+    }
+    if name not in transports:
+        raise ValueError(f"Unknown ESP transport: {name}")
+    logger.info(f"Using {name} transport for ESP commands")
+    return transports[name](timeout=timeout)
@@ -0,0 +1,104 @@
+import numpy as np
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+# Pipeline stages in the order a frame passes through them
+STAGES = ("capture_queue", "preprocess", "detection", "decision", "network")
+
+
+class FrameTrace:
+    """Stage timings for one frame, starting from its capture timestamp"""
+
+    def __init__(self, capture_ts: float):
+        self.capture_ts = capture_ts
+        self.stages: Dict[str, float] = {}
+        self.actuated: List[int] = []
+        self._last = capture_ts
+
+    def mark(self, stage: str):
+        """Close `stage`, attributing the time since the previous mark to it"""
+        now = time.monotonic()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.capture_ts
+
+    def to_dict(self) -> dict:
+        return {
+            "capture_ts": self.capture_ts,
+            "esps": self.actuated,
+            "total_ms": round(self.total * 1000, 2),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()},
+        }
+
+
+class LatencyTracer:
+    """Collects per-frame stage timings and motion-to-actuation events"""
+
+    def __init__(self, history: int = 1000):
+        """
+        Args:
+            history (int): Number of recent frames and events kept for summaries
+        """
+        self.frames = deque(maxlen=history)
+        self.events = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def start(self, capture_ts: Optional[float] = None, detection_time: float = 0.0) -> FrameTrace:
+        """
+        Begin tracing a frame; the capture queue stage ends now.
+        detection_time is person detection already run for this frame in a
+        batch, which is moved out of the capture queue stage into detection.
+        """
+        trace = FrameTrace(capture_ts if capture_ts is not None else time.monotonic())
+        trace.mark("capture_queue")
+        if detection_time:
+            trace.stages["capture_queue"] = max(0.0, trace.stages["capture_queue"] - detection_time)
+            trace.stages["detection"] = detection_time
+        return trace
+
+    def finish(self, trace: FrameTrace):
+        """Record a traced frame, and an event if it switched any ESP"""
+        with self._lock:
+            self.frames.append(trace)
+            if trace.actuated:
+                self.events.append(trace)
+
+    def recent_events(self, limit: int = 20) -> List[dict]:
+        with self._lock:
+            events = list(self.events)[-limit:]
+        return [event.to_dict() for event in events]
+
+    def summary(self) -> dict:
+        """p50/p95/p99 per stage over recent frames, and end-to-end over events"""
+        with self._lock:
+            frames = list(self.frames)
+            events = list(self.events)
+
+        stages = {}
+        for stage in STAGES:
+            samples = [trace.stages[stage] for trace in frames if stage in trace.stages]
+            if samples:
+                stages[stage] = _percentiles(samples)
+
+        return {
+            "frames": len(frames),
+            "events": len(events),
+            "stages": stages,
+            "frame_total": _percentiles([trace.total for trace in frames]) if frames else {},
+            "motion_to_actuation": _percentiles([trace.total for trace in events]) if events else {},
+        }
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "p99_ms": round(p99 * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
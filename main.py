@@ -1,12 +1,26 @@
+import time
+
+# Taken before the heavy imports so startup metrics cover them
+PROCESS_STARTED = time.monotonic()
+
 import cv2
 import numpy as np
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
 import threading
-import time
-import requests
 import logging
 from urllib.parse import urlparse
 import os
+import io
+from esp_calibration import load_esp_mapping
+from esp_health import ESPDeviceRegistry
+from esp_transport import HTTPTransport, create_transport
+from latency_tracing import LatencyTracer
+from person_detectors import HOGPersonDetector, create_person_detector
+from person_tracking import PersonTracker
+from occupancy_heatmap import OccupancyHeatmap
+from clip_recorder import ClipRecorder
+from camera_capture import CameraCapture
+from state_feed import StateFeed
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
@@ -19,7 +33,11 @@ app.template_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '
 
 class GridMotionDetector:
     def __init__(self, camera_url, esp_urls, grid_size=(2, 2), 
-                 min_activity_threshold=1000, fps_limit=10, max_retries=3):
+                 min_activity_threshold=1000, fps_limit=10, max_retries=3,
+                 cell_to_esp=None, transport=None, person_detector=None,
+                 detect_interval=1, room="room", clip_recorder=None,
+                 person_detector_factory=None, started_at=None, actuate=True,
+                 heatmap_dir="heatmaps", outage_policy="hold", outage_grace=10.0):
         self.camera_url = camera_url
         self.esp_urls = esp_urls
         self.grid_size = grid_size  # Changed to 2x2
@@ -27,20 +45,101 @@ class GridMotionDetector:
         self.previous_frame = None
         self.grid_activity = {}
         self.fps_limit = fps_limit
-        self.frame_counter = 0
         self.previous_led_states = {}
         self.max_retries = max_retries
         self.human_detected = False
-        self.camera = None
+        self.cell_activity = {}
+        # Offline analysis turns this off so no ESP commands are sent
+        self.actuate = actuate
+        # Camera frames arrive on a background thread that also handles reconnects
+        self.capture = CameraCapture(
+            camera_url, name=room,
+            on_connected=lambda: self._record_startup_metric("camera_connected")
+        )
+        # ESP states during camera outages: "hold", "on" or "off" after outage_grace seconds
+        if outage_policy not in ("hold", "on", "off"):
+            raise ValueError(f"Invalid outage policy: {outage_policy}")
+        self.outage_policy = outage_policy
+        self.outage_grace = outage_grace
+        self._outage_policy_applied = False
         self.manual_override = {}
+        # Cell to ESP mapping from calibration; cell index + 1 if none was loaded.
+        # Cells a loaded mapping leaves out have no lamp and drive nothing.
+        if cell_to_esp is None:
+            cell_to_esp = {cell: cell + 1 for cell in range(grid_size[0] * grid_size[1])}
+        self.cell_to_esp = cell_to_esp
+        # How commands reach the ESPs; blocking HTTP unless configured otherwise
+        self.transport = transport or HTTPTransport(timeout=0.5)
+        # Capture-to-actuation stage timings
+        self.latency_tracer = LatencyTracer()
+        # Device health; dead ESPs fail fast until a probe sees them again
+        self.device_registry = ESPDeviceRegistry(
+            esp_urls, failure_threshold=max_retries,
+            on_recovered=self.send_esp_command, probe=self.transport.probe
+        )
         
-        # Initialize HOG detector
-        self.hog = cv2.HOGDescriptor()
-        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        # Person detector is built on first use or by warm_up_detector,
+        # HOG unless another backend or factory is given
+        self._person_detector = person_detector
+        self._person_detector_factory = person_detector_factory or HOGPersonDetector
+        self._person_detector_lock = threading.Lock()
+        # Keeps person IDs between detector runs, which happen every detect_interval frames
+        self.person_tracker = PersonTracker(grid_size, detect_interval=detect_interval)
+        # Long-run occupancy heatmap from the motion masks and person boxes
+        self.room = room
+        self.heatmap = OccupancyHeatmap(room, snapshot_dir=heatmap_dir)
+        # Versioned cell states for the compact and delta status feeds
+        self.state_feed = StateFeed(room, grid_size[0] * grid_size[1])
+        # Optional evidence clips around occupancy events
+        self.clip_recorder = clip_recorder
+        # Staged startup: initializing -> connecting_camera -> running, or
+        # "error" for good if the configured person detector failed to load
+        self.state = "initializing"
+        self.detector_error = None
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self.startup_metrics = {}
         
         # Validate URLs
         self._validate_urls()
 
+    @property
+    def person_detector(self):
+        """Person detector, built on first access if warm-up has not finished"""
+        if self._person_detector is None:
+            with self._person_detector_lock:
+                if self._person_detector is None:
+                    try:
+                        self._person_detector = self._person_detector_factory()
+                    except Exception as e:
+                        # Fall back once rather than retrying a broken model every frame
+                        self.detector_error = f"Person detector failed to load, using HOG instead: {str(e)}"
+                        self.state = "error"
+                        logger.error(self.detector_error)
+                        self._person_detector = HOGPersonDetector()
+                    self._record_startup_metric("detector_ready")
+        return self._person_detector
+
+    def _record_startup_metric(self, name):
+        """Record seconds since start for a startup milestone, once"""
+        if name not in self.startup_metrics:
+            elapsed = time.monotonic() - self.started_at
+            self.startup_metrics[name] = round(elapsed, 3)
+            logger.info(f"Startup: {name} after {elapsed:.2f}s")
+
+    def warm_up_detector(self):
+        """Build the person detector ahead of the first frame"""
+        self.person_detector
+
+    def start_background_init(self):
+        """Connect the camera and warm up the person detector in parallel"""
+        self.state = "connecting_camera"
+        threading.Thread(target=self.warm_up_detector, daemon=True).start()
+        self.capture.start()
+
+    def get_startup_status(self):
+        """Return startup state and milestone timings in seconds"""
+        return {"state": self.state, "error": self.detector_error, "metrics": dict(self.startup_metrics)}
+
     def _validate_urls(self):
         """Validate the format of camera and ESP8266 URLs"""
         try:
@@ -57,69 +156,75 @@ class GridMotionDetector:
             logger.error(f"URL validation failed: {str(e)}")
             raise
 
-    def connect_camera(self):
-        """Connect to camera stream with retry mechanism"""
-        for attempt in range(self.max_retries):
-            try:
-                logger.info(f"Attempting to connect to camera (attempt {attempt + 1}/{self.max_retries})")
-                camera = cv2.VideoCapture(self.camera_url)
-                
-                if camera.isOpened():
-                    logger.info("Successfully connected to camera")
-                    return camera
-                else:
-                    logger.warning(f"Failed to open camera on attempt {attempt + 1}")
-                    if camera is not None:
-                        camera.release()
-                    
-                if attempt < self.max_retries - 1:
-                    time.sleep(2)
-                    
-            except Exception as e:
-                logger.error(f"Error connecting to camera: {str(e)}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(2)
-                    
-        raise ConnectionError("Failed to connect to camera after maximum retries")
-
     def send_esp_command(self, esp_number, state):
         """Send command directly to ESP8266 with retry mechanism"""
-        if esp_number not in self.esp_urls:
-            logger.error(f"No URL configured for ESP {esp_number}")
-            return False
-            
-        url = self.esp_urls[esp_number]
-        command = "on" if state else "off"
-        
+        return self.send_esp_commands({esp_number: state})[esp_number]
+
+    def send_esp_commands(self, states):
+        """Send commands to several ESP8266s in one transport batch with retry mechanism"""
+        results = {}
+        pending = {}
+        for esp_number, state in states.items():
+            results[esp_number] = False
+            if esp_number not in self.esp_urls:
+                logger.error(f"No URL configured for ESP {esp_number}")
+                continue
+            self.device_registry.set_desired(esp_number, state)
+            pending[esp_number] = state
+
         for attempt in range(self.max_retries):
-            try:
-                response = requests.get(f"{url}/{command}", timeout=0.5)
-                
-                if response.status_code == 200:
+            # Known-dead devices fail fast; the health probe restores them
+            batch = {}
+            for esp_number, state in pending.items():
+                if self.device_registry.allow(esp_number):
+                    batch[esp_number] = state
+                else:
+                    logger.debug(f"Skipping command to unreachable ESP {esp_number}")
+            if not batch:
+                break
+
+            if attempt > 0:
+                time.sleep(1)
+
+            commands = [(self.esp_urls[esp_number], "on" if state else "off")
+                        for esp_number, state in batch.items()]
+            outcomes = self.transport.send_many(commands)
+
+            for (esp_number, state), (ok, error) in zip(batch.items(), outcomes):
+                command = "on" if state else "off"
+                if ok:
                     logger.info(f"Successfully sent command {command} to ESP {esp_number}")
-                    return True
+                    self.device_registry.record_success(esp_number, state)
+                    results[esp_number] = True
+                    del pending[esp_number]
                 else:
-                    logger.warning(f"Failed to send command to ESP {esp_number}. Status: {response.status_code}")
-                    
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Error sending command to ESP {esp_number}: {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(1)
+                    logger.error(f"Error sending command {command} to ESP {esp_number}: {error}")
+                    self.device_registry.record_failure(esp_number, error)
+
+            if not pending:
+                break
                     
-        return False
+        return results
 
     def set_manual_override(self, esp_number, state):
         """Set manual override for a specific ESP8266"""
         self.manual_override[esp_number] = state
+        self.state_feed.publish(self.grid_activity, self.human_detected, self.manual_override)
         self.send_esp_command(esp_number, state)
 
     def clear_manual_override(self, esp_number):
         """Clear manual override for a specific ESP8266"""
         if esp_number in self.manual_override:
             del self.manual_override[esp_number]
+            self.state_feed.publish(self.grid_activity, self.human_detected, self.manual_override)
 
-    def process_frame(self, frame):
-        """Process frame and divide into grid"""
+    def process_frame(self, frame, capture_ts=None, humans=None, detection_time=0.0):
+        """
+        Process frame and divide into grid, tracing latency from capture_ts.
+        humans can carry person boxes already found by a batched detector call
+        that took detection_time seconds.
+        """
+        trace = self.latency_tracer.start(capture_ts, detection_time)
         height, width = frame.shape[:2]
         cell_height = height // self.grid_size[0]
         cell_width = width // self.grid_size[1]
@@ -134,9 +239,12 @@ class GridMotionDetector:
         frame_diff = cv2.absdiff(self.previous_frame, gray)
         thresh = cv2.threshold(frame_diff, 25, 255, cv2.THRESH_BINARY)[1]
         self.previous_frame = gray
+        trace.mark("preprocess")
         
         grid_activity = {}
-        frame, human_detected = self.detect_humans(frame)
+        frame, human_detected = self.detect_humans(frame, humans)
+        trace.mark("detection")
+        self.heatmap.update(thresh, [track.box for track in self.person_tracker.tracks])
 
         for i in range(self.grid_size[0]):
             for j in range(self.grid_size[1]):
@@ -150,63 +258,97 @@ class GridMotionDetector:
                 
                 grid_index = i * self.grid_size[1] + j
                 is_active = activity > self.min_activity_threshold
-                grid_activity[grid_index] = is_active
+                grid_activity[grid_index] = bool(is_active)
+                self.cell_activity[grid_index] = int(activity)
                 
                 color = (0, 0, 255) if (is_active or human_detected) else (0, 255, 0)
                 cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
 
-        self.update_esp_states(grid_activity, human_detected)
+        if self.clip_recorder is not None and human_detected != self.human_detected:
+            self.clip_recorder.trigger("human_detected")
+
+        self.update_esp_states(grid_activity, human_detected, trace)
         self.grid_activity = grid_activity
         self.human_detected = human_detected
+        self.state_feed.publish(grid_activity, human_detected, self.manual_override)
+        self.latency_tracer.finish(trace)
+
+        if self.clip_recorder is not None:
+            self.clip_recorder.push(frame)
         
         return frame, grid_activity
 
-    def detect_humans(self, frame):
-        """Detect humans using HOG + SVM"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        humans, _ = self.hog.detectMultiScale(gray, winStride=(8, 8), padding=(16, 16), scale=1.05)
+    def detect_humans(self, frame, humans=None):
+        """Detect humans using the configured person detector and track them between runs"""
+        if humans is None and self.person_tracker.detection_due():
+            humans = self.person_detector.detect(frame)
+        tracks = self.person_tracker.update(frame, humans)
         
-        for (x, y, w, h) in humans:
+        for track in tracks:
+            x, y, w, h = track.box
             cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 255), 2)
+            cv2.putText(frame, f"#{track.track_id}", (x, max(y - 5, 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
             
-        return frame, len(humans) > 0
+        return frame, len(tracks) > 0
 
-    def update_esp_states(self, grid_activity, human_detected):
+    def update_esp_states(self, grid_activity, human_detected, trace=None):
         """Update ESP8266 LED states based on grid activity and manual overrides"""
+        # Turn on LED if there's motion in any of its cells or a human is detected
+        desired_states = {}
         for grid_index, is_active in grid_activity.items():
-            esp_number = grid_index + 1
-            
+            esp_number = self.cell_to_esp.get(grid_index)
+            if esp_number is None:
+                continue
+            desired_states[esp_number] = desired_states.get(esp_number, False) or is_active or human_detected
+
+        changed_states = {}
+        for esp_number, new_state in desired_states.items():
             # Skip if manual override is active
             if esp_number in self.manual_override:
                 continue
                 
-            # Turn on LED if there's motion in the grid or a human is detected
-            new_state = is_active or human_detected
-            
             # Only send command if state has changed
             if self.previous_led_states.get(esp_number) != new_state:
-                self.send_esp_command(esp_number, new_state)
+                changed_states[esp_number] = new_state
                 self.previous_led_states[esp_number] = new_state
 
+        if trace is not None:
+            trace.mark("decision")
+        if self.state not in ("running", "error"):
+            self.state = "running"
+        self._record_startup_metric("first_decision")
+
+        if changed_states and self.actuate:
+            if self.clip_recorder is not None:
+                for state in set(changed_states.values()):
+                    self.clip_recorder.trigger("esp_on" if state else "esp_off")
+            self.send_esp_commands(changed_states)
+            if trace is not None:
+                trace.mark("network")
+                trace.actuated = sorted(changed_states)
+
     def run(self):
         """Main loop for video processing"""
+        self.device_registry.start()
+        self.start_background_init()
+        frame_number = 0
         while True:
             try:
-                if self.camera is None or not self.camera.isOpened():
-                    self.camera = self.connect_camera()
-                
-                ret, frame = self.camera.read()
-                if not ret:
-                    logger.warning("Failed to read frame, attempting to reconnect...")
-                    self.camera.release()
-                    self.camera = None
+                # Newest frame only; stale frames are dropped by the capture thread
+                frame, capture_ts, frame_number = self.capture.read(frame_number, timeout=1.0)
+                if frame is None:
+                    self._handle_camera_outage()
                     continue
                 
-                self.frame_counter += 1
-                if self.frame_counter % (30 // self.fps_limit) != 0:
-                    continue
+                if self._outage_policy_applied:
+                    logger.info("Camera is back, resuming automatic control")
+                    self._outage_policy_applied = False
+                    # The pre-outage frame is no baseline for motion
+                    self.previous_frame = None
+                self._record_startup_metric("first_frame")
                 
-                processed_frame, grid_activity = self.process_frame(frame)
+                processed_frame, grid_activity = self.process_frame(frame, capture_ts)
                 cv2.imshow('Grid Motion Detection with Human Detection', processed_frame)
                 
                 if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -216,23 +358,45 @@ class GridMotionDetector:
                 
             except Exception as e:
                 logger.error(f"Error in main loop: {str(e)}")
-                if self.camera is not None:
-                    self.camera.release()
-                    self.camera = None
-                time.sleep(2)
+                time.sleep(1 / self.fps_limit)
                 
         self.cleanup()
 
+    def _handle_camera_outage(self):
+        """Apply the outage policy once the camera has been gone for outage_grace seconds"""
+        if self.capture.connected or self._outage_policy_applied:
+            return
+        if self.capture.current_outage_seconds() < self.outage_grace:
+            return
+
+        self._outage_policy_applied = True
+        if self.outage_policy == "hold":
+            logger.warning("Camera unavailable, holding last known ESP states")
+            return
+
+        state = self.outage_policy == "on"
+        logger.warning(f"Camera unavailable, switching ESPs {self.outage_policy} until it returns")
+        fail_safe_states = {}
+        for esp_number in self.esp_urls:
+            if esp_number in self.manual_override:
+                continue
+            fail_safe_states[esp_number] = state
+            self.previous_led_states[esp_number] = state
+        self.send_esp_commands(fail_safe_states)
+
     def cleanup(self):
         """Cleanup resources"""
         logger.info("Cleaning up resources...")
         try:
             # Turn off all LEDs
-            for esp_number in self.esp_urls.keys():
-                self.send_esp_command(esp_number, False)
+            self.send_esp_commands({esp_number: False for esp_number in self.esp_urls})
             
-            if self.camera is not None:
-                self.camera.release()
+            self.device_registry.stop()
+            self.transport.close()
+            self.heatmap.snapshot()
+            if self.clip_recorder is not None:
+                self.clip_recorder.close()
+            self.capture.stop()
             cv2.destroyAllWindows()
             
         except Exception as e:
@@ -246,30 +410,112 @@ class GridMotionDetector:
         """Return human detection status"""
         return {"human_detected": self.human_detected}
 
+    def get_occupancy(self):
+        """Return per-cell headcounts, dwell times and tracked people"""
+        return self.person_tracker.summary()
+
+def process_camera_batch(detectors, frames, person_detector, capture_ts=None):
+    """
+    Process one frame per camera with a single batched person detection call.
+    capture_ts holds each frame's capture timestamp, in the same order.
+    """
+    if capture_ts is None:
+        capture_ts = [None] * len(frames)
+    # Only cameras whose tracker is due for a detector run join the batch
+    due = [index for index, grid_detector in enumerate(detectors)
+           if grid_detector.person_tracker.detection_due()]
+    boxes = [None] * len(frames)
+    detection_started = time.monotonic()
+    for index, found in zip(due, person_detector.detect_batch([frames[index] for index in due])):
+        boxes[index] = found
+    # The batch ran before any frame's trace started, so credit it to detection
+    detection_time = time.monotonic() - detection_started if due else 0.0
+    return [
+        grid_detector.process_frame(frame, frame_ts, humans,
+                                    detection_time if humans is not None else 0.0)
+        for grid_detector, frame, frame_ts, humans in zip(detectors, frames, capture_ts, boxes)
+    ]
+
 # Global detector instance
 detector = None
 
+def initializing_response():
+    """503 returned by every endpoint until the detector exists"""
+    return jsonify({"state": "initializing"}), 503
+
 @app.route('/status')
 def status():
-    """API endpoint to get current status"""
+    """
+    API endpoint to get current status
+
+    ?format=compact returns the bit-packed cell states (see StateFeed) and
+    ?since=<seq> returns only the cells changed after that version. Both are
+    built once per state version and shared by all clients.
+    """
     if detector is None:
-        return jsonify({"error": "Detector not initialized"}), 500
+        return initializing_response()
     
+    if request.args.get('format') == 'compact':
+        return Response(detector.state_feed.compact(), mimetype='application/octet-stream')
+
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "since must be an integer sequence number"}), 400
+        return Response(detector.state_feed.delta(since), mimetype='application/json')
+
     activity = detector.get_grid_activity()
     human_status = detector.get_human_detection_status()
     manual_overrides = detector.manual_override
     
     return jsonify({
+        "seq": detector.state_feed.seq,
         "grid_activity": activity,
         "human_detected": human_status["human_detected"],
-        "manual_overrides": manual_overrides
+        "manual_overrides": manual_overrides,
+        "devices": detector.device_registry.snapshot(),
+        "occupancy": detector.get_occupancy(),
+        "startup": detector.get_startup_status(),
+        "camera": detector.capture.metrics()
     })
 
+@app.route('/latency')
+def latency():
+    """API endpoint for capture-to-actuation latency percentiles"""
+    if detector is None:
+        return initializing_response()
+
+    return jsonify({
+        "summary": detector.latency_tracer.summary(),
+        "recent_events": detector.latency_tracer.recent_events()
+    })
+
+@app.route('/heatmap')
+def heatmap():
+    """API endpoint for the occupancy heatmap as a PNG image or .npy array"""
+    if detector is None:
+        return initializing_response()
+
+    if request.args.get('format', 'png') == 'npy':
+        heat = detector.heatmap.get()
+        if heat is None:
+            return jsonify({"error": "No frames processed yet"}), 503
+        buffer = io.BytesIO()
+        np.save(buffer, heat)
+        return Response(buffer.getvalue(), mimetype='application/octet-stream')
+
+    png = detector.heatmap.to_png()
+    if png is None:
+        return jsonify({"error": "No frames processed yet"}), 503
+    return Response(png, mimetype='image/png')
+
 @app.route('/override', methods=['POST'])
 def override():
     """API endpoint to set manual override"""
     if detector is None:
-        return jsonify({"error": "Detector not initialized"}), 500
+        return initializing_response()
         
     try:
         data = request.get_json()
@@ -318,21 +564,35 @@ def run_with_error_handling():
             4: "http://192.168.137.104",  # ESP8266 #4
         }
         
-        # Initialize detector
+        # Serve the API first; every endpoint reports "initializing" until the detector exists
+        web_server_thread = threading.Thread(target=run_web_server)
+        web_server_thread.daemon = True
+        web_server_thread.start()
+
+        # Initialize detector; the person detector and camera come up in the background
+        person_detector_name = os.environ.get("PERSON_DETECTOR", "hog")
         detector = GridMotionDetector(
             camera_url=DROID_CAM_URL,
             esp_urls=ESP_URLS,
             grid_size=(2, 2),  # Changed to 2x2 grid
             min_activity_threshold=1000,
             fps_limit=10,
-            max_retries=3
+            max_retries=3,
+            detect_interval=5,
+            room="classroom",
+            outage_policy="on",
+            outage_grace=30.0,
+            clip_recorder=ClipRecorder(room="classroom", fps=10, quiet_hours=(20, 6)),
+            cell_to_esp=load_esp_mapping("esp_mapping.json", grid_size=(2, 2)),
+            transport=create_transport(os.environ.get("ESP_TRANSPORT", "http")),
+            person_detector_factory=lambda: create_person_detector(
+                person_detector_name,
+                model_path=os.environ.get("PERSON_DETECTOR_MODEL"),
+                config_path=os.environ.get("PERSON_DETECTOR_CONFIG")
+            ),
+            started_at=PROCESS_STARTED
         )
 
-        # Start Flask web server
-        web_server_thread = threading.Thread(target=run_web_server)
-        web_server_thread.daemon = True
-        web_server_thread.start()
-
         # Start motion detection
         detector.run()
         
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+import logging
+import os
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class OccupancyHeatmap:
+    """
+    Long-run occupancy heatmap for one room, finer than the control grid
+
+    Motion masks and person boxes are downsampled into a fixed float32
+    array and blended in place with an exponential moving average, so
+    memory stays constant and older activity fades out. The map is
+    snapshotted to disk periodically and reloaded on restart.
+    """
+
+    def __init__(self, room: str, downscale: int = 8, decay: float = 1e-4,
+                 box_weight: float = 1.0, snapshot_dir: Optional[str] = "heatmaps",
+                 snapshot_interval: float = 300.0):
+        """
+        Args:
+            room (str): Room name, used for the snapshot file
+            downscale (int): Frame pixels per heatmap pixel along each axis
+            decay (float): Weight of each new frame; 1e-4 at 10 fps averages
+                over roughly the last 15-30 minutes
+            box_weight (float): Value added inside person boxes (motion is 0-1)
+            snapshot_dir (str): Directory for .npy snapshots; None keeps the
+                heatmap in memory only
+            snapshot_interval (float): Seconds between snapshots
+        """
+        self.room = room
+        self.downscale = downscale
+        self.decay = decay
+        self.box_weight = box_weight
+        self.snapshot_path = os.path.join(snapshot_dir, f"{room}.npy") if snapshot_dir else None
+        self.snapshot_interval = snapshot_interval
+        self.heat: Optional[np.ndarray] = None
+        self.frames = 0
+        self._motion = None
+        self._sample = None
+        self._last_snapshot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _allocate(self, frame_shape: Tuple[int, int]):
+        height = max(1, frame_shape[0] // self.downscale)
+        width = max(1, frame_shape[1] // self.downscale)
+        self._motion = np.zeros((height, width), dtype=np.uint8)
+        self._sample = np.zeros((height, width), dtype=np.float32)
+        self.heat = np.zeros((height, width), dtype=np.float32)
+
+        if self.snapshot_path is None:
+            return
+        try:
+            saved = np.load(self.snapshot_path)
+            if saved.shape == self.heat.shape:
+                self.heat[:] = saved
+                logger.info(f"Restored occupancy heatmap for {self.room} from {self.snapshot_path}")
+        except (OSError, ValueError):
+            pass
+
+    def update(self, thresh: np.ndarray, boxes: Sequence[Tuple[int, int, int, int]] = ()):
+        """Blend one frame's motion mask and person boxes into the heatmap"""
+        if self.heat is None:
+            self._allocate(thresh.shape[:2])
+
+        height, width = self.heat.shape
+        cv2.resize(thresh, (width, height), dst=self._motion, interpolation=cv2.INTER_AREA)
+        np.multiply(self._motion, 1 / 255, out=self._sample, casting="same_kind")
+
+        for x, y, w, h in boxes:
+            x1 = max(0, x // self.downscale)
+            y1 = max(0, y // self.downscale)
+            x2 = min(width, (x + w) // self.downscale + 1)
+            y2 = min(height, (y + h) // self.downscale + 1)
+            self._sample[y1:y2, x1:x2] += self.box_weight
+
+        with self._lock:
+            cv2.accumulateWeighted(self._sample, self.heat, self.decay)
+            self.frames += 1
+
+        if time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def get(self) -> Optional[np.ndarray]:
+        """Copy of the current heatmap, or None before the first frame"""
+        with self._lock:
+            return None if self.heat is None else self.heat.copy()
+
+    def snapshot(self):
+        """Write the heatmap to snapshot_path atomically"""
+        heat = self.get()
+        self._last_snapshot = time.monotonic()
+        if heat is None or self.snapshot_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            temp_path = f"{self.snapshot_path}.tmp.npy"
+            np.save(temp_path, heat)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Failed to snapshot heatmap for {self.room}: {e}")
+
+    def to_png(self) -> Optional[bytes]:
+        """Heatmap as a color-mapped PNG, scaled to its own maximum"""
+        heat = self.get()
+        if heat is None:
+            return None
+        peak = float(heat.max())
+        scaled = (heat * (255 / peak)).astype(np.uint8) if peak > 0 else heat.astype(np.uint8)
+        ok, png = cv2.imencode(".png", cv2.applyColorMap(scaled, cv2.COLORMAP_JET))
+        return png.tobytes() if ok else None
@@ -0,0 +1,209 @@
+import cv2
+import numpy as np
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+from person_detectors import PersonDetector
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed for Parquet output
+    pa = None
+    pq = None
+
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+# Rows buffered before a Parquet row group is written
+ROW_GROUP_SIZE = 2000
+
+
+class NoPersonDetector(PersonDetector):
+    """Skips person detection when only motion activity is being tuned"""
+
+    name = "none"
+
+    def detect(self, frame):
+        return []
+
+
+class ColumnWriter:
+    """Streams per-frame rows to Parquet, or collects them into a .npz file"""
+
+    def __init__(self, path: str, columns: List[str]):
+        self.path = path
+        self.columns = columns
+        self._rows: Dict[str, list] = {name: [] for name in columns}
+        self._chunks: Dict[str, list] = {name: [] for name in columns}
+        self._writer = None
+
+    def append(self, row: dict):
+        for name in self.columns:
+            self._rows[name].append(row[name])
+        if len(self._rows[self.columns[0]]) >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows[self.columns[0]]:
+            return
+        if self.path.endswith(".parquet"):
+            table = pa.table({name: values for name, values in self._rows.items()})
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            for name, values in self._rows.items():
+                self._chunks[name].append(np.asarray(values))
+        self._rows = {name: [] for name in self.columns}
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+        elif not self.path.endswith(".parquet"):
+            np.savez_compressed(self.path, **{
+                name: np.concatenate(chunks) if chunks else np.array([])
+                for name, chunks in self._chunks.items()
+            })
+
+
+def analyze_video(path: str, output_path: str, grid_size, min_activity_threshold: int,
+                  frame_step: int, detect_interval: int, detect_people: bool) -> dict:
+    """Run GridMotionDetector over one video without display, pacing or ESP I/O"""
+    from main import GridMotionDetector
+
+    # One process per video already uses every core
+    cv2.setNumThreads(1)
+
+    grid_detector = GridMotionDetector(
+        camera_url="file://offline",
+        esp_urls={},
+        grid_size=grid_size,
+        min_activity_threshold=min_activity_threshold,
+        detect_interval=detect_interval,
+        person_detector=None if detect_people else NoPersonDetector(),
+        actuate=False,
+        heatmap_dir=None,
+    )
+
+    cells = grid_size[0] * grid_size[1]
+    columns = ["frame", "time_s", "human_detected", "people"]
+    columns += [f"cell_{cell}_activity" for cell in range(cells)]
+    columns += [f"cell_{cell}_active" for cell in range(cells)]
+    writer = ColumnWriter(output_path, columns)
+
+    capture = cv2.VideoCapture(path)
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    started = time.perf_counter()
+    frame_index = -1
+    rows = 0
+    try:
+        while True:
+            # Skipped frames are grabbed without decoding
+            for _ in range(frame_step - 1):
+                if not capture.grab():
+                    break
+                frame_index += 1
+            ret, frame = capture.read()
+            if not ret:
+                break
+            frame_index += 1
+
+            _, grid_activity = grid_detector.process_frame(frame)
+            if not grid_activity:
+                continue
+
+            row = {
+                "frame": frame_index,
+                "time_s": frame_index / video_fps,
+                "human_detected": grid_detector.human_detected,
+                "people": len(grid_detector.person_tracker.tracks),
+            }
+            for cell in range(cells):
+                row[f"cell_{cell}_activity"] = grid_detector.cell_activity[cell]
+                row[f"cell_{cell}_active"] = grid_activity[cell]
+            writer.append(row)
+            rows += 1
+    finally:
+        capture.release()
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    video_seconds = (frame_index + 1) / video_fps
+    return {
+        "video": path,
+        "output": output_path,
+        "rows": rows,
+        "elapsed_s": round(elapsed, 1),
+        "speedup": round(video_seconds / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def find_videos(paths: List[str]) -> List[str]:
+    videos = []
+    for path in paths:
+        if os.path.isfile(path):
+            videos.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            videos.extend(os.path.join(root, name) for name in sorted(files)
+                          if name.lower().endswith(VIDEO_EXTENSIONS))
+    return videos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze recorded classroom footage faster than real time")
+    parser.add_argument("inputs", nargs="+", help="Video files or directories of videos")
+    parser.add_argument("--output-dir", default="analysis", help="Directory for per-video column files")
+    parser.add_argument("--format", choices=["parquet", "npz"], default="parquet" if pq else "npz",
+                        help="Output format (parquet needs pyarrow)")
+    parser.add_argument("--grid", type=int, nargs=2, default=(2, 2), metavar=("ROWS", "COLS"),
+                        help="Grid layout (default: 2 2)")
+    parser.add_argument("--min-activity-threshold", type=int, default=1000,
+                        help="Threshold used for the cell_N_active columns")
+    parser.add_argument("--frame-step", type=int, default=3,
+                        help="Analyze every Nth frame; 3 gives 10 analyzed frames per second of 30 fps video")
+    parser.add_argument("--detect-interval", type=int, default=5,
+                        help="Run the person detector every N analyzed frames")
+    parser.add_argument("--no-people", action="store_true",
+                        help="Skip person detection and record motion activity only")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parallel processes")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and pq is None:
+        parser.error("parquet output needs pyarrow; install it or use --format npz")
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        parser.error("No videos found")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    logger.info(f"Analyzing {len(videos)} videos with {args.workers} workers")
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for index, video in enumerate(videos):
+            stem = os.path.splitext(os.path.basename(video))[0]
+            output_path = os.path.join(args.output_dir, f"{index:04d}_{stem}.{args.format}")
+            future = pool.submit(analyze_video, video, output_path, tuple(args.grid),
+                                 args.min_activity_threshold, max(1, args.frame_step),
+                                 args.detect_interval, not args.no_people)
+            futures[future] = video
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                logger.info(f"{result['video']}: {result['rows']} rows in {result['elapsed_s']}s "
+                            f"({result['speedup']}x real time) -> {result['output']}")
+            except Exception as e:
+                logger.error(f"Failed to analyze {futures[future]}: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
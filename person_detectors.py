@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+import logging
+import os
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (x, y, w, h) in frame pixels
+Box = Tuple[int, int, int, int]
+
+
+class PersonDetector:
+    """Interface for person detectors used by GridMotionDetector"""
+
+    name = "base"
+
+    def detect(self, frame: np.ndarray) -> List[Box]:
+        """Detect people in one BGR frame"""
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames: Sequence[np.ndarray]) -> List[List[Box]]:
+        """Detect people in several frames, e.g. one per camera"""
+        return [self.detect(frame) for frame in frames]
+
+
+class HOGPersonDetector(PersonDetector):
+    """OpenCV's default HOG + SVM people detector"""
+
+    name = "hog"
+
+    def __init__(self, win_stride=(8, 8), padding=(16, 16), scale=1.05):
+        self.win_stride = win_stride
+        self.padding = padding
+        self.scale = scale
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def detect(self, frame: np.ndarray) -> List[Box]:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        humans, _ = self.hog.detectMultiScale(gray, winStride=self.win_stride,
+                                              padding=self.padding, scale=self.scale)
+        return [tuple(int(v) for v in box) for box in humans]
+
+
+class DNNPersonDetector(PersonDetector):
+    """
+    Lightweight CPU DNN detector through OpenCV's dnn module
+
+    Expects a single-shot detector with the standard DetectionOutput layout
+    (rows of [image_id, class_id, confidence, x1, y1, x2, y2] with normalized
+    coordinates), such as MobileNet-SSD in Caffe, TensorFlow or ONNX form.
+    Frames from several cameras are stacked into one blob and run as a
+    single forward pass.
+    """
+
+    name = "dnn"
+
+    def __init__(self, model_path: str, config_path: Optional[str] = None,
+                 input_size: Tuple[int, int] = (300, 300), scale: float = 1 / 127.5,
+                 mean: Tuple[float, float, float] = (127.5, 127.5, 127.5),
+                 swap_rb: bool = False, person_class_id: int = 15,
+                 confidence: float = 0.5):
+        """
+        Args:
+            model_path (str): Model weights file (.caffemodel, .pb, .onnx, ...)
+            config_path (str): Network description if the format needs one (.prototxt, .pbtxt)
+            input_size (Tuple[int, int]): Network input (width, height)
+            scale (float): Pixel scale factor applied before inference
+            mean (Tuple[float, float, float]): Mean subtracted from each channel
+            swap_rb (bool): Whether the model expects RGB instead of BGR
+            person_class_id (int): Class index of "person" (15 for VOC MobileNet-SSD)
+            confidence (float): Minimum detection confidence
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Person detection model not found: {model_path}")
+
+        self.input_size = input_size
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+        self.person_class_id = person_class_id
+        self.confidence = confidence
+        self.net = cv2.dnn.readNet(model_path, config_path or "")
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def detect_batch(self, frames: Sequence[np.ndarray]) -> List[List[Box]]:
+        if not frames:
+            return []
+
+        blob = cv2.dnn.blobFromImages(list(frames), self.scale, self.input_size,
+                                      self.mean, swapRB=self.swap_rb, crop=False)
+        self.net.setInput(blob)
+        detections = self.net.forward().reshape(-1, 7)
+
+        results: List[List[Box]] = [[] for _ in frames]
+        for image_id, class_id, confidence, x1, y1, x2, y2 in detections:
+            if int(class_id) != self.person_class_id or confidence < self.confidence:
+                continue
+            image_id = int(image_id)
+            if not 0 <= image_id < len(frames):
+                continue
+            height, width = frames[image_id].shape[:2]
+            left = int(max(0.0, x1) * width)
+            top = int(max(0.0, y1) * height)
+            right = int(min(1.0, x2) * width)
+            bottom = int(min(1.0, y2) * height)
+            results[image_id].append((left, top, right - left, bottom - top))
+        return results
+
+
+def create_person_detector(name: str = "hog", model_path: Optional[str] = None,
+                           config_path: Optional[str] = None) -> PersonDetector:
+    """Build a person detector by name: hog or dnn"""
+    if name == "hog":
+        detector = HOGPersonDetector()
+    elif name == "dnn":
+        if model_path is None:
+            raise ValueError("The dnn person detector needs a model file")
+        detector = DNNPersonDetector(model_path, config_path)
+    else:
+        raise ValueError(f"Unknown person detector: {name}")
+    logger.info(f"Using {name} person detector")
+    return detector
@@ -0,0 +1,207 @@
+import cv2
+import logging
+import time
+from itertools import count
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (x, y, w, h) in frame pixels
+Box = Tuple[int, int, int, int]
+
+
+def iou(a: Box, b: Box) -> float:
+    """Intersection over union of two (x, y, w, h) boxes"""
+    left = max(a[0], b[0])
+    top = max(a[1], b[1])
+    right = min(a[0] + a[2], b[0] + b[2])
+    bottom = min(a[1] + a[3], b[1] + b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+# KCF only: MIL and CSRT run once per person per frame and can cost more than the detector they stand in for
+CV_TRACKER_FACTORIES = ("TrackerKCF_create", "legacy.TrackerKCF_create")
+
+_cv_tracker_factory = None
+_cv_tracker_resolved = False
+
+
+def _create_cv_tracker():
+    """KCF if this OpenCV build has it (opencv-contrib), else None"""
+    global _cv_tracker_factory, _cv_tracker_resolved
+    if not _cv_tracker_resolved:
+        _cv_tracker_resolved = True
+        for name in CV_TRACKER_FACTORIES:
+            factory = cv2
+            try:
+                for part in name.split("."):
+                    factory = getattr(factory, part)
+                factory()
+            except (AttributeError, cv2.error):
+                continue
+            _cv_tracker_factory = factory
+            break
+        else:
+            logger.warning("No KCF tracker in this OpenCV build (needs opencv-contrib); "
+                           "person boxes will hold still between detector runs")
+    return _cv_tracker_factory() if _cv_tracker_factory is not None else None
+
+
+class Track:
+    """One tracked person"""
+
+    def __init__(self, track_id: int, box: Box, cell: Optional[int], now: float):
+        self.track_id = track_id
+        self.box = box
+        self.cell = cell
+        self.first_seen = now
+        self.cell_entered = now
+        self.missed = 0
+        self.cv_tracker = None
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "id": self.track_id,
+            "box": list(self.box),
+            "cell": self.cell,
+            "dwell_seconds": round(now - self.cell_entered, 1),
+            "age_seconds": round(now - self.first_seen, 1),
+        }
+
+
+class PersonTracker:
+    """
+    Keeps person identities between detector runs
+
+    The detector only runs every `detect_interval` frames. Detections are
+    associated with existing tracks by IoU; in between, boxes are
+    propagated with OpenCV's KCF tracker where available and
+    otherwise hold still until the next detection. A track survives
+    `max_missed` detector runs without a match, so brief misses do not
+    drop occupancy.
+    """
+
+    def __init__(self, grid_size: Tuple[int, int], detect_interval: int = 1,
+                 iou_threshold: float = 0.3, max_missed: int = 2,
+                 use_cv_trackers: bool = True):
+        """
+        Args:
+            grid_size (Tuple[int, int]): Grid layout used for headcounts
+            detect_interval (int): Run the detector once every N frames
+            iou_threshold (float): Minimum IoU to match a detection to a track
+            max_missed (int): Detector runs a track may go unmatched before it is dropped
+            use_cv_trackers (bool): Propagate boxes with OpenCV trackers between
+                detector runs; otherwise boxes hold still
+        """
+        self.grid_size = grid_size
+        self.detect_interval = max(1, detect_interval)
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.use_cv_trackers = use_cv_trackers
+        self.tracks: List[Track] = []
+        self.cell_dwell_seconds: Dict[int, float] = {}
+        self._ids = count(1)
+        self._frames_since_detection = self.detect_interval
+        self._frame_shape = None
+        self._last_update = None
+
+    def detection_due(self) -> bool:
+        """Whether the next frame should be passed to the person detector"""
+        return self._frames_since_detection >= self.detect_interval - 1
+
+    def update(self, frame, detections: Optional[Sequence[Box]] = None) -> List[Track]:
+        """Advance one frame; pass detections on frames where the detector ran"""
+        now = time.monotonic()
+        self._frame_shape = frame.shape[:2]
+
+        if detections is not None:
+            self._associate(frame, [tuple(int(v) for v in box) for box in detections], now)
+            self._frames_since_detection = 0
+        else:
+            self._propagate(frame)
+            self._frames_since_detection += 1
+
+        self._update_cells(now)
+        return self.tracks
+
+    def _associate(self, frame, detections: List[Box], now: float):
+        pairs = sorted(
+            ((iou(track.box, box), t, d) for t, track in enumerate(self.tracks)
+             for d, box in enumerate(detections)),
+            reverse=True
+        )
+        matched_tracks = set()
+        matched_detections = set()
+        for overlap, t, d in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_detections:
+                continue
+            matched_tracks.add(t)
+            matched_detections.add(d)
+            self.tracks[t].box = detections[d]
+            self.tracks[t].missed = 0
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for d, box in enumerate(detections):
+            if d not in matched_detections:
+                self.tracks.append(Track(next(self._ids), box, self._cell_of(box), now))
+
+        if self.use_cv_trackers:
+            for track in self.tracks:
+                if track.missed == 0:
+                    track.cv_tracker = _create_cv_tracker()
+                    if track.cv_tracker is not None:
+                        track.cv_tracker.init(frame, track.box)
+
+    def _propagate(self, frame):
+        for track in self.tracks:
+            if track.cv_tracker is None:
+                continue
+            ok, box = track.cv_tracker.update(frame)
+            if ok:
+                track.box = tuple(int(v) for v in box)
+
+    def _cell_of(self, box: Box) -> Optional[int]:
+        if self._frame_shape is None:
+            return None
+        height, width = self._frame_shape
+        rows, cols = self.grid_size
+        center_x = box[0] + box[2] / 2
+        center_y = box[1] + box[3] / 2
+        row = min(max(int(center_y * rows / height), 0), rows - 1)
+        col = min(max(int(center_x * cols / width), 0), cols - 1)
+        return row * cols + col
+
+    def _update_cells(self, now: float):
+        elapsed = now - self._last_update if self._last_update is not None else 0.0
+        self._last_update = now
+        for track in self.tracks:
+            if track.cell is not None:
+                self.cell_dwell_seconds[track.cell] = self.cell_dwell_seconds.get(track.cell, 0.0) + elapsed
+            cell = self._cell_of(track.box)
+            if cell != track.cell:
+                track.cell = cell
+                track.cell_entered = now
+
+    def headcounts(self) -> Dict[int, int]:
+        """Number of tracked people per grid cell"""
+        counts: Dict[int, int] = {}
+        for track in self.tracks:
+            if track.cell is not None:
+                counts[track.cell] = counts.get(track.cell, 0) + 1
+        return counts
+
+    def summary(self) -> dict:
+        now = time.monotonic()
+        return {
+            "headcount": self.headcounts(),
+            "dwell_seconds": {cell: round(seconds, 1) for cell, seconds in self.cell_dwell_seconds.items()},
+            "tracks": [track.to_dict(now) for track in self.tracks],
+        }
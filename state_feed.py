@@ -0,0 +1,99 @@
+import numpy as np
+import json
+import struct
+import threading
+from collections import deque
+from typing import Dict
+
+# seq (uint32), cell count (uint16), flags (uint8, bit 0 = human detected)
+COMPACT_HEADER = struct.Struct("<IHB")
+
+
+class StateFeed:
+    """
+    Versioned cell states for one room, with encodings cached per version
+
+    Every change to the cell states, human detection or manual overrides
+    bumps the sequence number. Encoded responses are built on first
+    request for a version and shared by every client until the next one:
+
+    - compact(): COMPACT_HEADER followed by the cell states bit-packed
+      LSB first, one bit per cell
+    - delta(since): JSON with only the cells changed after `since`, or the
+      full state with "full": true if `since` is too old or unknown
+    """
+
+    def __init__(self, room: str, cells: int, history: int = 256):
+        """
+        Args:
+            room (str): Room name included in JSON responses
+            cells (int): Number of grid cells
+            history (int): Versions kept for delta responses
+        """
+        self.room = room
+        self.seq = 0
+        self._states = np.zeros(cells, dtype=bool)
+        self._human_detected = False
+        self._overrides: Dict[int, bool] = {}
+        self._changes = deque(maxlen=history)
+        self._cache: Dict[object, bytes] = {}
+        self._lock = threading.RLock()
+
+    def publish(self, grid_activity: Dict[int, bool], human_detected: bool,
+                manual_override: Dict[int, bool]) -> bool:
+        """Record the latest state, returning True if it started a new version"""
+        with self._lock:
+            changed = {cell: bool(state) for cell, state in grid_activity.items()
+                       if self._states[cell] != state}
+            if not changed and human_detected == self._human_detected and manual_override == self._overrides:
+                return False
+
+            for cell, state in changed.items():
+                self._states[cell] = state
+            self._human_detected = human_detected
+            self._overrides = dict(manual_override)
+            self.seq += 1
+            self._changes.append((self.seq, changed))
+            self._cache = {}
+            return True
+
+    def _cached(self, key, build) -> bytes:
+        with self._lock:
+            cache = self._cache
+            body = cache.get(key)
+            if body is None:
+                body = cache[key] = build()
+            return body
+
+    def compact(self) -> bytes:
+        """Bit-packed cell states with sequence number"""
+        def build():
+            header = COMPACT_HEADER.pack(self.seq, len(self._states), int(self._human_detected))
+            return header + np.packbits(self._states, bitorder="little").tobytes()
+        return self._cached("compact", build)
+
+    def delta(self, since: int) -> bytes:
+        """JSON with the cells that changed after version `since`"""
+        def build():
+            body = {
+                "room": self.room,
+                "seq": self.seq,
+                "human_detected": self._human_detected,
+                "manual_overrides": self._overrides,
+            }
+            if since is None:
+                body["full"] = True
+                body["changes"] = {cell: bool(state) for cell, state in enumerate(self._states)}
+            else:
+                changes = {}
+                for seq, changed in self._changes:
+                    if seq > since:
+                        changes.update(changed)
+                body["full"] = False
+                body["changes"] = changes
+            return json.dumps(body, separators=(",", ":")).encode()
+        with self._lock:
+            oldest = self._changes[0][0] if self._changes else self.seq + 1
+            if since > self.seq or since < oldest - 1:
+                since = None
+            return self._cached(("delta", since), build)